@@ -0,0 +1,379 @@
+"""Micro-benchmarks for the hot paths of loopy. Run `python benchmark.py`."""
+import numpy as np
+import soundfile as sf
+import os
+import sys
+import itertools
+import subprocess
+import tempfile
+from time import perf_counter
+from loopy.generator import adsr_envelope, ENVELOPE_CACHE, LOAD_BPM, LoopyPreset
+from loopy.pattern import LoopyPatternCore
+from loopy.track import LoopyTrack
+from loopy.channel import LoopyChannel
+from loopy.effect import LoopyHighpass, LoopySidechain, LoopyReverb, LoopyCompressor, LoopyBalance, LoopyDelay
+from loopy.utils import DEFAULT_SR, PIANO_KEYS, beat2index, add_y
+from loopy.utils import midi_id2piano_key, piano_key2midi_id, midi_ids2piano_keys, piano_keys2midi_ids
+from loopy.utils import note_seq_parser, chord_seq_parser, parse_note_seq, parse_chord_seq
+from loopy.corpus import LoopyCorpus
+
+
+# only imported at first use (plotting, playback, mel-spectrograms, decoding of non-wav files)
+LAZY_MODULES = ('librosa', 'matplotlib', 'PIL', 'playsound')
+
+
+def timeit(func, repeat: int = 5):
+    best = float('inf')
+    for _ in range(repeat):
+        st = perf_counter()
+        func()
+        best = min(best, perf_counter() - st)
+    return best
+
+
+def envelope_loop(attack, decay, sustain, release, note_value, bpm, sig='4/4', sr=DEFAULT_SR):
+    # the original per-sample implementation of LoopyPreset.envelope
+    beat_value = 1 / float(sig[-1])
+    num_sec_ads = 60 / bpm * note_value / beat_value
+    num_sec_ads = min(num_sec_ads, 60 / LOAD_BPM - release / 1000)
+    num_sec_a, num_sec_d, num_sec_r = attack / 1000, decay / 1000, release / 1000
+    num_sec_s = num_sec_ads - num_sec_a - num_sec_d
+    p1_idx = int(num_sec_a*sr)
+    p2_idx = int((num_sec_a+num_sec_d)*sr)
+    p3_idx = int((num_sec_a+num_sec_d+num_sec_s)*sr)
+    p4_idx = int((num_sec_ads+num_sec_r)*sr)
+    e = np.zeros(p4_idx)
+    for i in range(0, p1_idx):
+        e[i] = i / p1_idx
+    for i in range(p1_idx, p2_idx):
+        e[i] = 1 - (1-sustain) * (i-p1_idx) / (p2_idx-p1_idx)
+    for i in range(p2_idx, p3_idx):
+        e[i] = sustain
+    for i in range(p3_idx, p4_idx):
+        e[i] = sustain - sustain * (i-p3_idx) / (p4_idx-p3_idx)
+    return e, p4_idx
+
+
+def bench_envelope():
+    params = [
+        (0, 0, 1.0, 0, 1/4, 128),
+        (50, 0, 1.0, 0, 1/8, 128),
+        (5, 30, 0.6, 10, 3/16, 128),
+        (10, 100, 0.3, 200, 1/4, 100),
+    ]
+    for p in params:
+        ref, n_ref = envelope_loop(*p)
+        e, n = adsr_envelope(*p)
+        assert n == n_ref and np.array_equal(e, ref), f'envelope mismatch for {p}'
+
+    t_loop = timeit(lambda: [envelope_loop(*p) for p in params], repeat=3)
+    t_vec = timeit(lambda: [adsr_envelope(*p) for p in params])
+    ENVELOPE_CACHE.clear()
+    def memo():
+        for p in params:
+            key = p + ('4/4', DEFAULT_SR)
+            ENVELOPE_CACHE.get_or_create(key, lambda: (adsr_envelope(*p), 0))
+    t_memo = timeit(memo)
+    print(f'envelope: loop {t_loop*1e3:.2f} ms, vectorized {t_vec*1e3:.2f} ms ({t_loop/t_vec:.0f}x), memoized {t_memo*1e3:.3f} ms ({t_loop/t_memo:.0f}x)')
+
+
+def synthetic_preset(tmp_dir: str, name: str = 'synthetic.wav', sr: int = DEFAULT_SR):
+    # 88 one-beat notes at LOAD_BPM, enough to stand in for a real preset
+    rng = np.random.default_rng(0)
+    num_samples = int(88 * 60 * sr / LOAD_BPM)
+    y = 0.1 * rng.standard_normal((num_samples, 2)).astype(np.float32)
+    path = os.path.join(tmp_dir, name)
+    sf.write(path, y, sr)
+    return path
+
+
+def bench_mixer(tmp_dir: str):
+    rng = np.random.default_rng(0)
+    generators = [LoopyPreset(synthetic_preset(tmp_dir), balance_db=db) for db in (-6, -12)]
+    keys = PIANO_KEYS[39:51]
+    for layout, num_notes in itertools.product(('random', 'riff'), (100, 1000, 10000)):
+        core = LoopyPatternCore(num_bars=max(1, num_notes // 16))
+        beats = core._num_bars * core._beats_per_bar
+        if layout == 'random':
+            for _ in range(num_notes):
+                core.add_note(
+                    key_name=keys[rng.integers(len(keys))],
+                    note_value=1/16 * rng.integers(1, 5),
+                    pos_in_pattern=beats * rng.random(),
+                    generator=generators[rng.integers(len(generators))],
+                )
+        else:
+            # a one-bar riff of 16th notes repeated on every bar, the layout of generated patterns
+            riff = [(keys[rng.integers(len(keys))], generators[rng.integers(len(generators))]) for _ in range(16)]
+            for i in range(num_notes):
+                key_name, generator = riff[i % 16]
+                core.add_note(key_name=key_name, note_value=1/16, pos_in_pattern=i / 4, generator=generator)
+        core.render()  # warm the note cache so that both paths only mix
+
+        def per_note():
+            y = np.zeros((core._tot_samples, 2), dtype=np.float32)
+            for note in core._notes:
+                st_index = beat2index(note._pos_in_pattern, bpm=core._bpm, sr=core._sr)
+                add_y(y, note.render(bpm=core._bpm, sig=core._sig), st_index)
+            return y
+
+        def batched():
+            core.invalidate()
+            return core.render()
+
+        assert np.array_equal(per_note(), batched()), 'batched mix differs from the per-note loop'
+        t_loop = timeit(per_note, repeat=3)
+        t_batch = timeit(batched, repeat=3)
+        print(f'mixer ({layout}, {num_notes} notes): per-note {t_loop*1e3:.1f} ms, batched {t_batch*1e3:.1f} ms ({t_loop/t_batch:.1f}x)')
+
+
+def synthetic_track(tmp_dir: str, num_bars: int = 8, dtype: np.dtype = np.float32):
+    rng = np.random.default_rng(0)
+    track = LoopyTrack(name='synthetic', length=f'00:{1.875*num_bars}', dtype=dtype)
+    generator = LoopyPreset(synthetic_preset(tmp_dir), balance_db=-12)
+    for part in range(4):
+        core = LoopyPatternCore(num_bars=num_bars)
+        for pos in np.arange(0, num_bars * 4, 0.5):
+            core.add_note(PIANO_KEYS[rng.integers(30, 60)], 1/8, pos, generator, attack=5, release=20)
+        channel = LoopyChannel(name=f'part-{part}', part=('lead', 'chord', 'bass', 'sub')[part], effects=[
+            LoopyHighpass(100 * (part + 1)),
+            LoopySidechain(attain=0.3, mag=0.6),
+            LoopyReverb(dry_level=0.75, wet_level=0.5),
+            LoopyCompressor(thres=-12, ratio=10),
+            LoopyBalance(-3),
+        ])
+        track.add_pattern(core, 0, 0, channel)
+    return track
+
+
+def bench_dtype(tmp_dir: str):
+    track32 = synthetic_track(tmp_dir, dtype=np.float32)
+    track64 = synthetic_track(tmp_dir, dtype=np.float64)
+    y32, y64 = track32.render(), track64.render()
+    assert y32.dtype == np.float32 and y64.dtype == np.float64
+    err = np.abs(y32 - y64).max() / np.abs(y64).max()
+    assert err < 1e-5, f'float32 render deviates from float64 by {err:.2e} (relative to peak)'
+    t32, t64 = timeit(track32.render, repeat=3), timeit(track64.render, repeat=3)
+    print(f'dtype: float64 {t64*1e3:.0f} ms, float32 {t32*1e3:.0f} ms, max deviation {err:.1e} of peak')
+
+
+def bench_parallel(tmp_dir: str):
+    track = synthetic_track(tmp_dir, num_bars=16)
+    ref = track.render()
+    for num_workers in (2, 4):
+        assert np.array_equal(track.render(num_workers=num_workers), ref), 'parallel render differs from the sequential one'
+    t_seq = timeit(track.render, repeat=3)
+    t_par = timeit(lambda: track.render(num_workers=4), repeat=3)
+    print(f'parallel: sequential {t_seq*1e3:.0f} ms, 4 workers {t_par*1e3:.0f} ms ({t_seq/t_par:.1f}x)')
+
+
+def bench_import():
+    # a fresh interpreter, this one has already imported loopy
+    check = f'import sys, loopy; print(",".join(m for m in {LAZY_MODULES!r} if m in sys.modules))'
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', check], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '', f'`import loopy` eagerly imports {out.stdout.strip()}'
+    # the last line of -X importtime is the top-level package: "import time: self | cumulative | loopy"
+    tot_us = int(out.stderr.strip().splitlines()[-1].split('|')[1])
+    print(f'import: loopy {tot_us/1e3:.0f} ms, none of {", ".join(LAZY_MODULES)} loaded')
+
+
+def bench_store(tmp_dir: str):
+    # presets resolved through a relative PRESET_DIR, as with the default configuration
+    os.makedirs(os.path.join(tmp_dir, 'presets'))
+    synthetic_preset(os.path.join(tmp_dir, 'presets'))
+    setup = 'import sys, numpy as np, loopy.generator, loopy.store; loopy.generator.PRESET_DIR = loopy.store.PRESET_DIR = "presets"; '
+    compile_preset = setup + 'loopy.store.compile_preset("synthetic.wav", "store"); np.save("ref.npy", loopy.generator.LoopyPreset("synthetic.wav")._y)'
+    open_preset = setup + 'y = loopy.generator.LoopyPreset("synthetic.wav", store_dir="store")._y; np.save("store.npy", y); print("librosa" in sys.modules)'
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    for check in (compile_preset, open_preset):
+        out = subprocess.run([sys.executable, '-W', 'ignore', '-c', check], cwd=tmp_dir, env=env, capture_output=True, text=True)
+        assert out.returncode == 0, f'store-backed preset fails with a relative PRESET_DIR:\n{out.stderr}'
+    assert out.stdout.strip() == 'False', 'opening a fresh store imports librosa'
+    assert np.array_equal(np.load(os.path.join(tmp_dir, 'ref.npy')), np.load(os.path.join(tmp_dir, 'store.npy'))), 'store differs from decoding'
+    print('store: relative PRESET_DIR resolved once, fresh store opened without librosa')
+
+
+def bench_stream(tmp_dir: str, num_bars: int = 8):
+    track = synthetic_track(tmp_dir, num_bars=num_bars)
+    # a placement that starts in the middle of a block, with a delay tail that must carry across blocks
+    core = LoopyPatternCore(num_bars=2)
+    generator = LoopyPreset(synthetic_preset(tmp_dir), balance_db=-12)
+    for pos in np.arange(0, 8, 0.75):
+        core.add_note(PIANO_KEYS[40], 1/8, pos, generator, attack=5, release=20)
+    channel = LoopyChannel(name='offbeat', part='lead', effects=[
+        LoopyHighpass(300),
+        LoopyDelay(delay_seconds=0.3, feedback=0.5, mix=0.3),
+        LoopyReverb(dry_level=0.75, wet_level=0.5),
+        LoopyCompressor(thres=-12, ratio=10),
+    ])
+    track.add_pattern(core, num_bars // 2, 0.5, channel)
+    assert track.timeline().starts()[-1] % 4096, 'the placement should not be block-aligned'
+
+    y = track.render()
+    for block_size in (4096, 12345, 65536):
+        blocks = np.concatenate(list(track.render_blocks(block_size=block_size)))
+        assert np.array_equal(blocks, y), f'streaming in blocks of {block_size} differs from render()'
+    t_render = timeit(lambda: track.render(), repeat=3)
+    t_stream = timeit(lambda: sum(block.shape[0] for block in track.render_blocks(block_size=4096)), repeat=3)
+    print(f'stream: render {t_render*1e3:.0f} ms, blocks of 4096 {t_stream*1e3:.0f} ms, identical with a non-aligned placement')
+
+
+def bench_window(tmp_dir: str):
+    track = synthetic_track(tmp_dir, num_bars=32)
+    full = track.render()
+    st_index, ed_index = track.bar2index(8), track.bar2index(16)
+    err = np.abs(track.render(st_bar=8, ed_bar=16) - full[st_index:ed_index]).max() / np.abs(full).max()
+    assert err < 1e-2, f'window render deviates from the full render by {err:.2e} (relative to peak)'
+
+    def cold(func):
+        # a mel crop renders a fresh track, drop the pattern buffers kept from the last call
+        for pattern in track._patterns:
+            pattern._core.invalidate()
+        return func()
+    t_full = timeit(lambda: cold(lambda: track.render()[st_index:ed_index]), repeat=3)
+    t_window = timeit(lambda: cold(lambda: track.render(st_bar=8, ed_bar=16)), repeat=3)
+    print(f'window (8 of 32 bars): full {t_full*1e3:.0f} ms, window {t_window*1e3:.0f} ms ({t_full/t_window:.1f}x), max deviation {err:.1e} of peak')
+
+
+def bench_remix(tmp_dir: str, num_variants: int = 100):
+    track = synthetic_track(tmp_dir, num_bars=16)
+    y, _ = track.render_stems()
+    stems = track.stems(path=os.path.join(tmp_dir, 'stems.npy'))
+    err = np.abs(stems.remix() - y).max() / np.abs(y).max()
+    assert err < 1e-5, f'remix deviates from the stem mix by {err:.2e} (relative to peak)'
+
+    rng = np.random.default_rng(0)
+    variants = [({part: rng.uniform(-6, 0) for part in stems.parts()}, [stems.parts()[rng.integers(len(stems))]]) for _ in range(num_variants)]
+    def rerender():
+        for pattern in track._patterns:
+            pattern._core.invalidate()
+        return track.render()
+    t_render = timeit(rerender, repeat=3)
+    t_remix = timeit(lambda: [stems.remix(gains, mute) for gains, mute in variants], repeat=3)
+    print(f'remix: render {t_render*1e3:.0f} ms, {num_variants} variants {t_remix*1e3:.0f} ms ({t_remix/num_variants*1e3:.1f} ms each)')
+
+
+def bench_compiled(tmp_dir: str):
+    track = synthetic_track(tmp_dir, num_bars=16)
+    patterns = [(pattern._core.render(), pattern._channel) for pattern in track._patterns]
+    compiled = [LoopyChannel(channel._name, channel._effects, compiled=True) for _, channel in patterns]
+    for (y, channel), compiled_channel in zip(patterns, compiled):
+        assert np.array_equal(channel(y), compiled_channel(y)), 'compiled chain differs from the effect-by-effect chain'
+    t_fx = timeit(lambda: [channel(y) for y, channel in patterns], repeat=3)
+    t_compiled = timeit(lambda: [compiled_channel(y) for (y, _), compiled_channel in zip(patterns, compiled)], repeat=3)
+    print(f'compiled chain: per effect {t_fx*1e3:.0f} ms, compiled {t_compiled*1e3:.0f} ms ({t_fx/t_compiled:.2f}x)')
+
+
+def read_corpus(path: str = 'raw_80.txt'):
+    # the melody and chord lines of every record of the corpus (header, melody, chord, blank)
+    with open(path, 'r') as f:
+        lines = f.readlines()
+    melodies = [np.array(line.split(), dtype=np.int64) for line in lines[1::4]]
+    chords = [np.array(line.split(), dtype=np.int64) for line in lines[2::4]]
+    return melodies, chords
+
+
+def read_melodies(path: str = 'raw_80.txt'):
+    return read_corpus(path)[0]
+
+
+def bench_pitch(path: str = 'raw_80.txt'):
+    melodies = read_melodies(path)
+    midi_ids = np.concatenate(melodies)
+    midi_ids = midi_ids[midi_ids != 0].tolist()  # 0 is a rest
+    def by_search():
+        # the linear search piano_key2midi_id used to do
+        return [PIANO_KEYS.index(midi_id2piano_key(x)) + 21 for x in midi_ids]
+    def by_table():
+        return [piano_key2midi_id(midi_id2piano_key(x)) for x in midi_ids]
+    def by_array():
+        return piano_keys2midi_ids(midi_ids2piano_keys(midi_ids))
+    assert by_search() == midi_ids and by_table() == midi_ids and by_array().tolist() == midi_ids
+    t_search, t_table, t_array = timeit(by_search), timeit(by_table), timeit(by_array)
+    print(f'pitch round trip ({len(midi_ids)} notes of {len(melodies)} melodies): list search {t_search*1e3:.1f} ms, '
+          f'table {t_table*1e3:.1f} ms ({t_search/t_table:.1f}x), arrays {t_array*1e3:.1f} ms ({t_search/t_array:.1f}x)')
+
+
+def as_tuples(score):
+    # columnar notes as the (key name, note value, pos) tuples of the legacy parsers
+    return list(zip(midi_ids2piano_keys(score['midi_id']).tolist(), score['note_value'].tolist(), score['pos'].tolist()))
+
+
+def legacy_chords(chord_seq, note_seq, **kwargs):
+    # chord_seq_parser iterates the (notes, root) pair get_chord_notes returns, keep the notes and their lowest one
+    score, roots = chord_seq_parser(chord_seq, note_seq, **kwargs)
+    score = [(key_name, note_value, pos) for key_names, note_value, pos in score if isinstance(key_names, list) for key_name in key_names]
+    roots = [(key_names[0], note_value, pos) for key_names, note_value, pos in roots]
+    return score, roots
+
+
+def bench_parser(path: str = 'raw_80.txt'):
+    import warnings
+    melodies, chords = read_corpus(path)
+    lists = [(melody.tolist(), chord.tolist()) for melody, chord in zip(melodies, chords)]
+    settings = [dict(), dict(max_value=1/8), dict(max_value=3/16, decr_octave=False, incr_octave=True, decor_map={1: [10], 4: [2, 14]})]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        for kwargs in settings:
+            note_kwargs = {'max_value': kwargs['max_value']} if 'max_value' in kwargs else dict()
+            for melody, chord in zip(melodies, chords):
+                assert as_tuples(parse_note_seq(melody, **note_kwargs)) == note_seq_parser(melody.tolist(), **note_kwargs), 'notes differ from note_seq_parser'
+                for note_seq in (melody, None):
+                    score, roots = parse_chord_seq(chord, note_seq, **kwargs)
+                    legacy_score, legacy_roots = legacy_chords(chord.tolist(), None if note_seq is None else note_seq.tolist(), **kwargs)
+                    assert as_tuples(score) == legacy_score and as_tuples(roots) == legacy_roots, 'chords differ from chord_seq_parser'
+        t_legacy = timeit(lambda: [(note_seq_parser(melody), chord_seq_parser(chord, melody)) for melody, chord in lists], repeat=3)
+    t_array = timeit(lambda: [(parse_note_seq(melody), parse_chord_seq(chord, melody)) for melody, chord in zip(melodies, chords)], repeat=3)
+
+    # the whole corpus as one batch
+    melodies, chords = np.stack(melodies), np.stack(chords)
+    score, _ = parse_chord_seq(chords, melodies)
+    for i in range(len(melodies)):
+        row = score['seq_id'] == i
+        assert as_tuples({name: column[row] for name, column in score.items()}) == as_tuples(parse_chord_seq(chords[i], melodies[i])[0]), 'batch differs'
+    t_batch = timeit(lambda: (parse_note_seq(melodies), parse_chord_seq(chords, melodies)), repeat=3)
+    print(f'sequence parser ({len(melodies)} records): loops {t_legacy*1e3:.1f} ms, arrays {t_array*1e3:.1f} ms ({t_legacy/t_array:.1f}x), '
+          f'one batch {t_batch*1e3:.2f} ms ({t_legacy/t_batch:.0f}x)')
+
+
+def bench_corpus(tmp_dir: str, path: str = 'raw_80.txt', num_copies: int = 250):
+    melodies, chords = read_corpus(path)
+    with open(path, 'r') as f:
+        text = f.read()
+    big_path = os.path.join(tmp_dir, 'corpus.txt')
+    with open(big_path, 'w') as f:
+        f.write(text * num_copies)
+
+    st = perf_counter()
+    corpus = LoopyCorpus(big_path)
+    t_index = perf_counter() - st
+    st = perf_counter()
+    corpus = LoopyCorpus(big_path)
+    t_open = perf_counter() - st
+    assert len(corpus) == num_copies * len(melodies), 'records are missing from the index'
+    for i, (melody, chord) in enumerate(corpus.records(0, 2 * len(melodies))):
+        assert np.array_equal(melody, melodies[i % len(melodies)]) and np.array_equal(chord, chords[i % len(chords)]), 'records differ from readlines'
+
+    t_readlines = timeit(lambda: read_corpus(big_path), repeat=1)
+    t_stream = timeit(lambda: sum(1 for _ in corpus), repeat=1)
+    record_ids = np.random.default_rng(0).integers(len(corpus), size=1000).tolist()
+    t_random = timeit(lambda: [corpus[i] for i in record_ids], repeat=1)
+    print(f'corpus ({len(corpus)} records, {os.path.getsize(big_path)/2**20:.0f} MiB): index {t_index*1e3:.0f} ms, reopen {t_open*1e3:.1f} ms, '
+          f'readlines {t_readlines*1e3:.0f} ms, stream {t_stream*1e3:.0f} ms, random access {t_random/len(record_ids)*1e6:.0f} us per record')
+
+
+if __name__ == '__main__':
+    bench_import()
+    bench_envelope()
+    bench_pitch()
+    bench_parser()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench_corpus(tmp_dir)
+        bench_store(tmp_dir)
+        bench_stream(tmp_dir)
+        bench_mixer(tmp_dir)
+        bench_dtype(tmp_dir)
+        bench_parallel(tmp_dir)
+        bench_window(tmp_dir)
+        bench_remix(tmp_dir)
+        bench_compiled(tmp_dir)
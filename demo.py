@@ -3,6 +3,7 @@ import numpy as np
 from loopy import LoopyTrack, LoopyPreset, LoopyPatternCore, PRESET_DIR, DEFAULT_SR, preview_notes, LoopySidechain, LoopyBalance
 from loopy.utils import *
 from loopy.rhythm import LoopyRhythm
+from loopy.corpus import LoopyCorpus
 import os
 import librosa
 from loopy.recipe import *
@@ -138,22 +139,11 @@ chord_line += [6] * 8
 chord_line += [4] * 8
 chord_line += [5] * 8"""
 
-"""with open('raw_80.txt', 'r') as f:
-    lines = f.readlines()
-    melody_line, chord_line = None, None
-    for i, line in tqdm(enumerate(lines), total=len(lines)):
-        if i % 4 == 1:
-            melody_line = [int(x) for x in line.strip().split()]
-        elif i % 4 == 2:
-            chord_line = [int(x) for x in line.strip().split()]
-
-        if melody_line and chord_line:
-            prog_track = prog_house(melody_line, chord_line, chord_sync=True, preview=False, style='Tobu', name='exp')
-            prog_track.save_audio(target_dir='D:\\Project 2023\\renders')
-            melody_line, chord_line = None, None
-
-            
-            prog_track.save()"""
+"""corpus = LoopyCorpus('raw_80.txt')
+for melody_line, chord_line in tqdm(corpus, total=len(corpus)):
+    prog_track = prog_house(melody_line.tolist(), chord_line.tolist(), chord_sync=True, preview=False, style='Tobu', name='exp')
+    prog_track.save_audio(target_dir='D:\\Project 2023\\renders')
+    prog_track.save()"""
 
 """melody_line_1 = '83 83 00 83 83 00 84 84 00 84 84 00 79 79 79 00 89 89 00 89 89 00 88 88 00 88 88 00 84 84 84 00 89 89 00 89 89 00 88 88 00 88 88 00 84 84 84 00 83 83 00 84 84 00 83 83 00 83 83 00 79 79 79 00 '
 melody_line_2 = '83 83 00 83 83 00 84 84 00 84 84 00 79 79 79 00 89 89 00 89 89 00 88 88 00 88 88 00 84 84 84 00 91 91 00 91 91 00 88 88 00 88 88 00 86 86 86 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 '
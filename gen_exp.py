@@ -1,29 +1,12 @@
-import matplotlib.pyplot as plt
-import numpy as np
-from loopy import LoopyTrack, LoopyPreset, LoopyPatternCore, PRESET_DIR, DEFAULT_SR, preview_notes, LoopySidechain, LoopyBalance
-from loopy.utils import *
-from loopy.rhythm import LoopyRhythm
-import os
-import librosa
 from loopy.recipe import *
-from tqdm import trange
-import random
+from loopy.dataset import LoopyDataset
 
-SCALE_ROOTS = ['B', 'C', 'C#', 'D', 'D#', 'E']
-SEED = 431
-random.seed(SEED)
-for i in trange(0, 1):
-    scale_root = random.choice(SCALE_ROOTS)
-    track = generate_track(
-        name=str(i),
-        seed=i,
+if __name__ == '__main__':
+    dataset = LoopyDataset(
         style=LoopyStyle0(),
+        render_dir='C:\\Users\\CA7AX\\LooPy\\renders',
+        data_dir='C:\\Users\\CA7AX\\LooPy\\data',
         melody_rep_bars=1,
-        scale_root=scale_root,
-        preview=False,
         # muted_parts=['lead', 'sub', 'bass']
     )
-    track.save_audio(save_name=f'{i}', target_dir='C:\\Users\\CA7AX\\LooPy\\renders')
-    track.save_json('C:\\Users\\CA7AX\\LooPy\\data')
-    track.get_mel(st_bar=0, ed_bar=8, save_dir='C:\\Users\\CA7AX\\LooPy\\data')
-    track.print_melody()
\ No newline at end of file
+    dataset.generate(range(0, 1))
@@ -4,6 +4,7 @@ from .effect import *
 from .generator import *
 from .pattern import *
 from .sample import *
+from .cache import *
 
 __version__ = '0.0.0'
 
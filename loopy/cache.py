@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Callable, Tuple
+import threading
+
+# exported by `from loopy import *`, modules import readonly as _readonly to keep it out of the package namespace
+__all__ = ['LoopyCache', 'cache_stats']
+
+CACHES = []  # every LoopyCache created in this process
+
+
+class LoopyCache():
+    def __init__(self,
+        name: str,
+        max_bytes: int = None,
+        max_items: int = None,
+    ) -> None:
+        """
+        A process-wide LRU cache with a byte budget.
+        Args:
+            name (str): name of the cache (used in stats).
+            max_bytes (int, optional): byte budget, least recently used entries are evicted beyond it. Defaults to None (unbounded).
+            max_items (int, optional): maximum number of entries. Defaults to None (unbounded).
+        """
+        self._name = name
+        self._max_bytes = max_bytes
+        self._max_items = max_items
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.RLock()
+        self._tot_bytes = 0
+        self.reset_stats()
+        CACHES.append(self)
+
+    def reset_stats(self):
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._evicted_bytes = 0
+
+    def get(self, key: Hashable, default: Any = None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key][0]
+            self._misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any, nbytes: int = 0):
+        with self._lock:
+            if key in self._entries:
+                self._tot_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._tot_bytes += nbytes
+            self._evict()
+        return value
+
+    def get_or_create(self, key: Hashable, create: Callable[[], Tuple[Any, int]]):
+        """
+        Look up a key and build the entry on a miss.
+        Args:
+            key (Hashable): the cache key.
+            create (Callable): returns (value, nbytes) for a missing key.
+        Returns:
+            value (Any): the cached or newly created value.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key][0]
+            self._misses += 1
+        # build outside the lock so that slow decodes do not block other keys
+        value, nbytes = create()
+        return self.put(key, value, nbytes)
+
+    def _evict(self):
+        while len(self._entries) > 1 and (
+            (self._max_bytes is not None and self._tot_bytes > self._max_bytes) or
+            (self._max_items is not None and len(self._entries) > self._max_items)
+        ):
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._tot_bytes -= nbytes
+            self._evictions += 1
+            self._evicted_bytes += nbytes
+
+    def resize(self, max_bytes: int = None, max_items: int = None):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._max_items = max_items
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tot_bytes = 0
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            'name': self._name,
+            'entries': len(self._entries),
+            'bytes': self._tot_bytes,
+            'max_bytes': self._max_bytes,
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_ratio': self._hits / lookups if lookups else 0.0,
+            'evictions': self._evictions,
+            'evicted_bytes': self._evicted_bytes,
+        }
+
+
+def cache_stats():
+    """
+    Returns:
+        stats (Dict[str, Dict]): stats of every cache in the process, keyed by cache name.
+    """
+    return {cache._name: cache.stats() for cache in CACHES}
+
+
+def readonly(y):
+    """
+    Mark an array as read-only so that it can be shared between callers.
+    """
+    y.flags.writeable = False
+    return y
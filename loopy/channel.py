@@ -1,25 +1,117 @@
-from loopy.effect import LoopyEffect
+from loopy.effect import LoopyEffect, optimize_effects
+from loopy.utils import DEFAULT_SR
+from pedalboard import Pedalboard
 import numpy as np
 from typing import List
+import threading
 
 class LoopyChannel():
     def __init__(self,
         # sr: int = 44100,
         name: str,
         effects: List[LoopyEffect] = None,
+        part: str = None,
+        compiled: bool = False,
+        optimized: bool = False,
     ) -> None:
+        """
+        Defines a mixer channel, a chain of effects.
+        Args:
+            name (str): name of the channel.
+            effects (List[LoopyEffect], optional): the effects, in processing order. Defaults to None.
+            part (str, optional): stem of the track this channel is mixed into, e.g. 'lead' or 'kick'. Defaults to None.
+            compiled (bool, optional): run consecutive pedalboard effects as one Pedalboard (see compile). Defaults to False.
+            optimized (bool, optional): run the chain rewritten by optimize_effects (see optimize). Defaults to False.
+        """
         # self._sr = sr
         self._name = name
         self._effects = effects if effects else list()  # list of LoopyEffect
+        self._part = part
+        self._compiled = compiled
+        self._optimized = optimized
+        self._chain = None  # built by compile(), dropped when the effects change
+        self._optimized_chain = None  # built by optimize(), dropped when the effects change
+        self._chain_lock = threading.Lock()
         
     def add_effect(self, fx: LoopyEffect):
         self._effects.append(fx)
+        self._chain = None
+        self._optimized_chain = None
+
+    def optimize(self):
+        """
+        Returns:
+            effects (List[LoopyEffect]): the chain with gains folded across linear stages and 0 dB gains dropped (see optimize_effects).
+            rewrites (List[str]): the rewrites applied.
+        """
+        if self._optimized_chain is None:
+            self._optimized_chain = optimize_effects(self._effects)
+        return self._optimized_chain
+
+    def rewrites(self):
+        return list(self.optimize()[1])
+
+    def effects(self):
+        """
+        Returns:
+            effects (List[LoopyEffect]): the effects this channel runs, optimized or as added.
+        """
+        return self.optimize()[0] if self._optimized else self._effects
+
+    def compile(self):
+        """
+        Group consecutive pedalboard-backed effects into single Pedalboard runs (one call and one output
+        buffer per group); NumPy effects such as the sidechain run between the groups. The groups hold
+        clones of the plugins, so their state is private to this channel. The output is the same as
+        running the effects one by one.
+        Returns:
+            chain (List): Pedalboard groups and LoopyEffect steps, in processing order.
+        """
+        if self._chain is None:
+            chain, plugins = [], []
+            for fx in self.effects():
+                plugin = fx.clone().plugin()
+                if plugin is None:
+                    if plugins:
+                        chain.append(Pedalboard(plugins))
+                        plugins = []
+                    chain.append(fx)
+                else:
+                    plugins.append(plugin)
+            if plugins:
+                chain.append(Pedalboard(plugins))
+            self._chain = chain
+        return self._chain
 
     def __call__(self, y: np.ndarray):
-        for fx in self._effects:
-            y = fx(y)
-            fx.reset()
-        return y
+        dtype = y.dtype
+        if self._compiled:
+            # the compiled plugins belong to this channel, one signal at a time
+            with self._chain_lock:
+                for step in self.compile():
+                    if isinstance(step, Pedalboard):
+                        y = step.process(y, sample_rate=DEFAULT_SR, reset=True)
+                    else:
+                        y = step(y)
+            return y.astype(dtype, copy=False)
+
+        for fx in self.effects():
+            # hold the effect across process and reset, so another thread cannot interleave
+            with fx._lock:
+                y = fx(y)
+                fx.reset()
+        # pedalboard effects return float32, keep the precision of the input
+        return y.astype(dtype, copy=False)
+
+    def open_stream(self, offset: int = 0):
+        """
+        Process a signal block by block through a private copy of this channel's effects.
+        Args:
+            offset (int, optional): sample index of the first block in the signal. Defaults to 0.
+        Returns:
+            stream (LoopyChannelStream): call it with consecutive blocks.
+        """
+        return LoopyChannelStream(self, offset)
     
     def __len__(self):
         return len(self._effects)
@@ -27,6 +119,7 @@ class LoopyChannel():
     def __dict__(self):
         return {
             'name': self._name,
+            'part': self._part,
             'effects': [effect.__dict__() for effect in self._effects]
         }
     
@@ -34,8 +127,34 @@ class LoopyChannel():
         return str(self.__dict__())"""
 
 
+class LoopyChannelStream():
+    def __init__(self,
+        channel: LoopyChannel,
+        offset: int = 0,
+    ) -> None:
+        """
+        Block-by-block state of a channel: effects keep their state between blocks
+        (pedalboard reset=False) and time-dependent effects such as the sidechain
+        see the position of each block in the whole signal.
+        Args:
+            channel (LoopyChannel): the channel to stream through.
+            offset (int, optional): sample index of the first block. Defaults to 0.
+        """
+        self._name = channel._name
+        self._effects = [fx.clone() for fx in channel.effects()]
+        self._offset = offset
+
+    def __call__(self, y: np.ndarray):
+        dtype = y.dtype
+        for fx in self._effects:
+            y = fx.stream(y, self._offset)
+        self._offset += y.shape[0]
+        return y.astype(dtype, copy=False)
+
+
 def merge_channels(name: str, channels: List[LoopyChannel]):
-    ret = LoopyChannel(name)
+    parts = set(channel._part for channel in channels)
+    ret = LoopyChannel(name, part=parts.pop() if len(parts) == 1 else None)
     for channel in channels:
         for fx in channel._effects:
             ret.add_effect(fx)
@@ -0,0 +1,213 @@
+import numpy as np
+import os
+import json
+import warnings
+from typing import List
+
+CORPUS_INDEX_VERSION = 1
+# one row per record: byte offsets of its header, melody and chord lines and of its end, and its number of steps
+INDEX_COLUMNS = ('header', 'melody', 'chord', 'end', 'num_steps')
+# records read at once when streaming
+DEFAULT_BLOCK_BYTES = 1 << 22
+
+_DIGITS = b'0123456789'
+_SPACES = b' \t\r\n'
+
+
+def parse_ints(buf: bytes):
+    """
+    Parse the integers of a buffer of digits and whitespace in one call, without splitting it into strings.
+    """
+    return np.fromstring(buf, dtype=np.int64, sep=' ')
+
+
+def build_index(path: str):
+    """
+    Scan a corpus once and locate its records. A record is a header line, a melody line and a chord line
+    of as many integers, followed by blank lines; anything else (missing or extra lines, lines that are not
+    integers, lines of different lengths) is skipped.
+    Args:
+        path (str): path to the corpus.
+    Returns:
+        index (np.ndarray): int64 array of shape (num_records, len(INDEX_COLUMNS)).
+        num_skipped (int): number of irregular records.
+    """
+    rows, num_skipped = [], 0
+    group = []  # (offset, line) of the non-blank lines of the current record
+
+    def close():
+        nonlocal num_skipped
+        if not group:
+            return
+        if len(group) == 3:
+            (header, _), (melody, melody_line), (chord, chord_line) = group
+            num_steps = len(melody_line.split())
+            if num_steps and len(chord_line.split()) == num_steps \
+                and not melody_line.translate(None, _DIGITS+_SPACES) \
+                and not chord_line.translate(None, _DIGITS+_SPACES):
+                rows.append((header, melody, chord, chord + len(chord_line), num_steps))
+                group.clear()
+                return
+        num_skipped += 1
+        group.clear()
+
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                group.append((offset, line))
+            else:
+                close()
+            offset += len(line)
+    close()
+    index = np.array(rows, dtype=np.int64).reshape(-1, len(INDEX_COLUMNS))
+    return index, num_skipped
+
+
+class LoopyCorpus():
+    def __init__(self,
+        path: str,
+        index_path: str = None,
+        persist: bool = True,
+        rebuild: bool = False,
+    ) -> None:
+        """
+        Indexed reader of a melody/chord corpus in the format of raw_80.txt (header, melody, chord, blank line).
+        The byte offsets of the records are found once (see build_index) and kept next to the corpus, so that
+        records are streamed or read at random as int64 arrays without loading the file.
+        Args:
+            path (str): path to the corpus.
+            index_path (str, optional): where the index is kept (a .npy with a .json next to it). Defaults to None (path + '.index.npy').
+            persist (bool, optional): save the index, it is reused while the size and mtime of the corpus stay the same. Defaults to True.
+            rebuild (bool, optional): scan the corpus even if a fresh index exists. Defaults to False.
+        """
+        self._path = path
+        self._index_path = path+'.index.npy' if index_path is None else index_path
+        self._meta_path = os.path.splitext(self._index_path)[0]+'.json'
+        if not rebuild and self.is_fresh():
+            # memory-mapped, shared by every worker reading the corpus
+            self._index = np.load(self._index_path, mmap_mode='r')
+            with open(self._meta_path, 'r') as f:
+                self._num_skipped = json.load(f)['num_skipped']
+        else:
+            stat = os.stat(path)
+            self._index, self._num_skipped = build_index(path)
+            if persist:
+                self.save_index(stat)
+        if self._num_skipped:
+            warnings.warn(f'{self._num_skipped} irregular records of {path} are skipped')
+
+    def is_fresh(self):
+        if not (os.path.exists(self._index_path) and os.path.exists(self._meta_path)):
+            return False
+        with open(self._meta_path, 'r') as f:
+            meta = json.load(f)
+        stat = os.stat(self._path)
+        return meta.get('version') == CORPUS_INDEX_VERSION \
+            and meta.get('mtime_ns') == stat.st_mtime_ns \
+            and meta.get('size') == stat.st_size
+
+    def save_index(self, stat: os.stat_result):
+        # write next to the target and rename, so that concurrent readers never see a partial index
+        tmp_suffix = f'.{os.getpid()}.tmp'
+        try:
+            with open(self._index_path+tmp_suffix, 'wb') as f:
+                np.save(f, self._index)
+            with open(self._meta_path+tmp_suffix, 'w') as f:
+                json.dump({
+                    'version': CORPUS_INDEX_VERSION,
+                    'path': os.path.realpath(self._path),
+                    'mtime_ns': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'num_records': len(self._index),
+                    'num_skipped': self._num_skipped,
+                }, f)
+            os.replace(self._index_path+tmp_suffix, self._index_path)
+            os.replace(self._meta_path+tmp_suffix, self._meta_path)
+        except OSError as e:
+            warnings.warn(f'could not save the index of {self._path} ({e}), it is kept in memory')
+
+    def __len__(self):
+        return len(self._index)
+
+    def num_steps(self):
+        """
+        Returns:
+            num_steps (np.ndarray): length of the melody (and chord) of every record.
+        """
+        return self._index[:, INDEX_COLUMNS.index('num_steps')]
+
+    def header(self, i: int):
+        header, melody = self._index[i, :2].tolist()
+        with open(self._path, 'rb') as f:
+            f.seek(header)
+            return f.read(melody - header).decode('utf-8').strip()
+
+    def __getitem__(self, i: int):
+        """
+        Returns:
+            melody (np.ndarray): the melody of record i.
+            chord (np.ndarray): the chords of record i.
+        """
+        _, melody, _, end, num_steps = self._index[i].tolist()
+        with open(self._path, 'rb') as f:
+            f.seek(melody)
+            values = parse_ints(f.read(end - melody))
+        return values[:num_steps], values[num_steps:]
+
+    def records(self, st: int = 0, ed: int = None, block_bytes: int = DEFAULT_BLOCK_BYTES):
+        """
+        Stream the records [st, ed) in order, reading blocks of consecutive records at once.
+        Args:
+            st (int, optional): first record. Defaults to 0.
+            ed (int, optional): one past the last record. Defaults to None (the end of the corpus).
+            block_bytes (int, optional): size of a block read. Defaults to 4 MiB.
+        Yields:
+            melody (np.ndarray), chord (np.ndarray): the sequences of a record.
+        """
+        ed = len(self) if ed is None else min(ed, len(self))
+        with open(self._path, 'rb') as f:
+            while st < ed:
+                # at least one record per block
+                block_ed = max(st + 1, int(np.searchsorted(self._index[st:ed, 3], self._index[st, 0] + block_bytes, side='right')) + st)
+                index = np.asarray(self._index[st:block_ed])
+                offset = int(index[0, 0])
+                f.seek(offset)
+                buf = f.read(int(index[-1, 3]) - offset)
+                values = parse_ints(b' '.join(buf[melody-offset:end-offset] for melody, end in index[:, [1, 3]].tolist()))
+                bounds = np.cumsum(2 * index[:, 4]).tolist()
+                for (num_steps, bound) in zip(index[:, 4].tolist(), bounds):
+                    record = values[bound-2*num_steps:bound]
+                    yield record[:num_steps], record[num_steps:]
+                st = block_ed
+
+    def __iter__(self):
+        return self.records()
+
+    def batch(self, record_ids: List[int] = None):
+        """
+        Read records of the same length as 2-d arrays, e.g. for parse_note_seq and parse_chord_seq.
+        Args:
+            record_ids (List[int], optional): the records. Defaults to None (every record).
+        Returns:
+            melodies (np.ndarray): melodies of shape (num_records, num_steps).
+            chords (np.ndarray): chords of shape (num_records, num_steps).
+        """
+        if record_ids is None:
+            records = list(self.records())
+        else:
+            records = [self[i] for i in record_ids]
+        if len(set(len(melody) for melody, _ in records)) > 1:
+            raise ValueError('records of different lengths cannot be batched')
+        melodies = np.array([melody for melody, _ in records], dtype=np.int64)
+        chords = np.array([chord for _, chord in records], dtype=np.int64)
+        return melodies, chords
+
+    def shards(self, num_shards: int):
+        """
+        Split the records into contiguous ranges of (nearly) equal size, one per worker.
+        Returns:
+            shards (List[Tuple[int, int]]): (st, ed) of every shard, to be read with records(st, ed).
+        """
+        bounds = np.linspace(0, len(self), num_shards + 1).astype(np.int64).tolist()
+        return list(zip(bounds[:-1], bounds[1:]))
@@ -0,0 +1,185 @@
+from loopy.recipe import LoopyStyleBase, generate_track
+from loopy.generator import LoopyPreset
+from loopy.sample import LoopySampleCore
+from loopy import store
+import os
+import json
+import random
+from time import perf_counter
+from typing import Dict, List, Iterable
+from concurrent.futures import ProcessPoolExecutor
+
+SCALE_ROOTS = ['B', 'C', 'C#', 'D', 'D#', 'E']
+
+
+def seed2scale_root(seed: int):
+    # derived from the seed alone, so a track does not depend on which tracks were generated before it
+    return random.Random(seed).choice(SCALE_ROOTS)
+
+
+def warm_caches(style: LoopyStyleBase):
+    """
+    Load every preset and drum sample of a style into the caches of this process.
+    """
+    for part in ('lead', 'chord', 'bass', 'sub'):
+        for info in style.sound_sheet[part]:
+            LoopyPreset(source_path=info['source_path'])
+    for info in style.sound_sheet['kick']:
+        LoopySampleCore(info['source_path'])
+    for info in style.sound_sheet['top']:
+        LoopySampleCore(info['source_path'], truncate=4)
+
+
+def _init_worker(style: LoopyStyleBase, store_dir: str):
+    if store_dir is not None:
+        store.PRESET_STORE_DIR = store_dir
+    warm_caches(style)
+
+
+def _generate_shard(
+    shard_name: str,
+    seeds: List[int],
+    style: LoopyStyleBase,
+    render_dir: str,
+    data_dir: str,
+    track_kwargs: Dict,
+    mel: bool,
+    melody: bool,
+    stems: bool,
+):
+    shard_render_dir = os.path.join(render_dir, shard_name)
+    shard_data_dir = os.path.join(data_dir, shard_name)
+    os.makedirs(shard_render_dir, exist_ok=True)
+    os.makedirs(shard_data_dir, exist_ok=True)
+
+    tracks = []
+    for seed in seeds:
+        st = perf_counter()
+        name = str(seed)
+        scale_root = seed2scale_root(seed)
+        track = generate_track(
+            name=name,
+            seed=seed,
+            style=style,
+            scale_root=scale_root,
+            preview=False,
+            **track_kwargs,
+        )
+        track.save_audio(save_name=name, target_dir=shard_render_dir, stems=stems)
+        track.save_json(shard_data_dir)
+        if mel:
+            track.get_mel(st_bar=0, ed_bar=8, save_dir=shard_data_dir)
+        if melody:
+            track.print_melody(save_dir=shard_data_dir)
+        tracks.append({
+            'seed': seed,
+            'scale_root': scale_root,
+            'audio_sec': track._tot_samples / track._sr,
+            'wall_sec': perf_counter() - st,
+        })
+
+    with open(os.path.join(shard_data_dir, 'manifest.json'), 'w') as f:
+        json.dump({'shard': shard_name, 'tracks': tracks}, f)
+    return tracks
+
+
+class LoopyDataset():
+    def __init__(self,
+        style: LoopyStyleBase,
+        render_dir: str,
+        data_dir: str,
+        num_workers: int = None,
+        shard_size: int = 64,
+        store_dir: str = None,
+        mel: bool = True,
+        melody: bool = True,
+        stems: bool = False,
+        **track_kwargs,
+    ) -> None:
+        """
+        Generates a dataset of tracks (audio, json, mel-spectrograms and melody plots) on a process pool.
+        A track only depends on its seed, so the outputs are the same as a serial run.
+        Args:
+            style (LoopyStyleBase): the style every track is composed in.
+            render_dir (str): directory of the rendered audio.
+            data_dir (str): directory of the annotations.
+            num_workers (int, optional): number of processes. Defaults to None (one per CPU), 1 runs in this process.
+            shard_size (int, optional): tracks per shard, each shard is written to its own sub-directory. Defaults to 64.
+            store_dir (str, optional): preset store shared by the workers through memory maps (see loopy.store). Defaults to None.
+            mel (bool, optional): save mel-spectrograms. Defaults to True.
+            melody (bool, optional): save melody plots. Defaults to True.
+            stems (bool, optional): save the stem of every part next to the mix. Defaults to False.
+            track_kwargs: passed on to generate_track (e.g. melody_rep_bars).
+        """
+        self._style = style
+        self._render_dir = os.path.abspath(render_dir)
+        self._data_dir = os.path.abspath(data_dir)
+        self._num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self._shard_size = shard_size
+        self._store_dir = None if store_dir is None else os.path.abspath(store_dir)
+        self._mel = mel
+        self._melody = melody
+        self._stems = stems
+        self._track_kwargs = track_kwargs
+        self._stats = None
+
+    def shards(self, seeds: Iterable[int]):
+        seeds = list(seeds)
+        return [
+            (f'shard-{seeds[i]:06d}', seeds[i:i+self._shard_size])
+            for i in range(0, len(seeds), self._shard_size)
+        ]
+
+    def generate(self, seeds: Iterable[int], verbose: bool = True):
+        """
+        Generate the tracks of the given seeds.
+        Args:
+            seeds (Iterable[int]): e.g. range(0, 10000).
+            verbose (bool, optional): print the throughput after each shard. Defaults to True.
+        Returns:
+            stats (Dict): number of tracks, seconds of audio, wall time and throughput.
+        """
+        shards = self.shards(seeds)
+        if self._store_dir is not None:
+            # compile once here instead of racing in every worker
+            store.compile_sound_sheet(self._style.sound_sheet, self._store_dir)
+
+        st = perf_counter()
+        tracks = []
+        initargs = (self._style, self._store_dir)
+        shard_args = [
+            (shard_name, shard_seeds, self._style, self._render_dir, self._data_dir, self._track_kwargs, self._mel, self._melody, self._stems)
+            for shard_name, shard_seeds in shards
+        ]
+        if self._num_workers <= 1:
+            store_dir = store.PRESET_STORE_DIR
+            try:
+                _init_worker(*initargs)
+                for args in shard_args:
+                    tracks += _generate_shard(*args)
+                    self._report(tracks, perf_counter() - st, verbose)
+            finally:
+                store.PRESET_STORE_DIR = store_dir
+        else:
+            with ProcessPoolExecutor(max_workers=self._num_workers, initializer=_init_worker, initargs=initargs) as pool:
+                for shard_tracks in pool.map(_generate_shard, *zip(*shard_args)):
+                    tracks += shard_tracks
+                    self._report(tracks, perf_counter() - st, verbose)
+
+        return self._report(tracks, perf_counter() - st, verbose=False)
+
+    def _report(self, tracks: List[Dict], wall_sec: float, verbose: bool):
+        audio_sec = sum(track['audio_sec'] for track in tracks)
+        self._stats = {
+            'tracks': len(tracks),
+            'audio_sec': audio_sec,
+            'wall_sec': wall_sec,
+            'tracks_per_min': 60 * len(tracks) / wall_sec if wall_sec else 0.0,
+            'audio_sec_per_sec': audio_sec / wall_sec if wall_sec else 0.0,
+        }
+        if verbose:
+            print(f"{self._stats['tracks']} tracks, {self._stats['tracks_per_min']:.1f} tracks/min, {self._stats['audio_sec_per_sec']:.1f} audio-sec/sec")
+        return self._stats
+
+    def stats(self):
+        return self._stats
@@ -1,22 +1,30 @@
 from typing import Any
 import numpy as np
-from loopy.utils import DEFAULT_SR, beat2index
+from loopy.utils import DEFAULT_SR, beat2index, mul_periodic, db2amp
+from loopy.cache import LoopyCache, readonly as _readonly
 from pedalboard import HighpassFilter, LowpassFilter, Reverb, Gain, Limiter, Compressor, Distortion, Delay
 from math import ceil
-import matplotlib.pyplot as plt
-from typing import Dict
+from typing import Dict, List
 from copy import deepcopy
+import threading
+
+# one cycle of the sidechain envelope, keyed by (length, attain, interp_order, mag, bpm, sr)
+SIDECHAIN_CACHE = LoopyCache('sidechain', max_items=256)
 
 
 class LoopyEffect():
     def __init__(self) -> None:
         self._params = {}
+        # pedalboard plugins are stateful, an effect shared by several channels
+        # (or rendered from several threads) must process one signal at a time
+        self._lock = threading.RLock()
     
     def add_param(self, k: str, v: Any):
         self._params[k] = v
 
     def __call__(self, y: np.ndarray, *args: Any, **kwds: Any) -> np.ndarray:
-        ret = self.forward(y, *args, **kwds)
+        with self._lock:
+            ret = self.forward(y, *args, **kwds)
         # self.reset()
         return ret
 
@@ -29,6 +37,32 @@ class LoopyEffect():
     def reset(self):
         pass
 
+    def plugin(self):
+        """
+        The pedalboard plugin behind this effect, or None for effects implemented in NumPy.
+        """
+        return None
+
+    def stream(self, y: np.ndarray, offset: int = 0) -> np.ndarray:
+        """
+        Process one block of a longer signal, keeping the effect state from the previous block.
+        Args:
+            y (np.ndarray): the block.
+            offset (int, optional): sample index of the block in the whole signal. Defaults to 0.
+        """
+        plugin = self.plugin()
+        if plugin is None:
+            return self.forward(y)
+        return plugin.process(y, sample_rate=DEFAULT_SR, reset=False)
+
+    def clone(self):
+        """
+        A copy with its own (fresh) state, e.g. for streaming several signals through the same settings.
+        """
+        ret = LoopyEffect()
+        ret._params = dict(self._params)
+        return ret
+
 
 class LoopyHighpass(LoopyEffect):
     def __init__(self, freq: int) -> None:
@@ -44,6 +78,12 @@ class LoopyHighpass(LoopyEffect):
     def reset(self):
         self.filter.reset()
 
+    def plugin(self):
+        return self.filter
+
+    def clone(self):
+        return LoopyHighpass(self._params['cutoff'])
+
 class LoopyLowpass(LoopyEffect):
     def __init__(self, freq: int) -> None:
         super().__init__()
@@ -58,6 +98,12 @@ class LoopyLowpass(LoopyEffect):
     def reset(self):
         self.filter.reset()
 
+    def plugin(self):
+        return self.filter
+
+    def clone(self):
+        return LoopyLowpass(self._params['cutoff'])
+
 class LoopyReverb(LoopyEffect):
     def __init__(self,
         room_size: float = 0.5,
@@ -91,6 +137,12 @@ class LoopyReverb(LoopyEffect):
     def reset(self):
         self.reverb.reset()
 
+    def plugin(self):
+        return self.reverb
+
+    def clone(self):
+        return LoopyReverb(**{k: v for k, v in self._params.items() if k != 'name'})
+
 class LoopySidechain(LoopyEffect):
     def __init__(self,
         length: float = 1.0,  # unit is beat
@@ -105,36 +157,53 @@ class LoopySidechain(LoopyEffect):
         self.add_param('interp_order', interp_order)
         self.add_param('mag', mag)
 
+    def envelope_unit(self, bpm: int = 128, sr: int = DEFAULT_SR):
+        """
+        One cycle of the envelope, with the dry/wet mix (mag) folded in.
+        """
+        def build():
+            # construct envelope (unit) for one cycle
+            envelope_unit = np.ones(beat2index(self._params['length'], bpm, sr), dtype=float)
+            attain_idx = beat2index(self._params['attain'], bpm, sr)
+            envelope_unit[:attain_idx] = np.power(np.arange(attain_idx)/attain_idx, self._params['interp_order'])
+            # y * envelope * mag + y * (1 - mag) == y * (envelope * mag + 1 - mag)
+            envelope_unit = _readonly(envelope_unit * self._params['mag'] + (1 - self._params['mag']))
+            return envelope_unit, envelope_unit.nbytes
+
+        key = (self._params['length'], self._params['attain'], self._params['interp_order'], self._params['mag'], bpm, sr)
+        return SIDECHAIN_CACHE.get_or_create(key, build)
+
     def forward(self,
         y: np.ndarray,
         bpm: int = 128,
         sr: int = DEFAULT_SR,
         debug: bool = False,
+        offset: int = 0,
     ):
-        # construct envelope (unit) for one cycle
-        envelope_unit = np.ones(beat2index(self._params['length'], bpm, sr), dtype=float)
-        attain_idx = beat2index(self._params['attain'], bpm, sr)
-        for i in range(attain_idx):
-            envelope_unit[i] = np.power(i/attain_idx, self._params['interp_order'])
-        # repeat the envelope (unit) for the complete envelope
-        num_repeat = ceil(y.shape[0]/envelope_unit.shape[0])
-        envelope = np.concatenate([envelope_unit]*num_repeat)[:y.shape[0]]
-        envelope = np.expand_dims(envelope, axis=-1)  # for element-wise product broadcast
-        # apply the envelope
-        ret = y * envelope
+        envelope_unit = self.envelope_unit(bpm, sr).astype(y.dtype, copy=False)
+        # apply the envelope cycle by cycle, starting at the phase of sample `offset`
+        ret = mul_periodic(y, envelope_unit, offset)
 
         if debug:
+            import matplotlib.pyplot as plt
             plt.plot(y[:, 0], c='mediumblue', label='inst_mono')
             plt.legend()
             plt.show()
             plt.close()
 
+            envelope = envelope_unit[(offset + np.arange(y.shape[0])) % envelope_unit.shape[0]]
             plt.plot(envelope, c='slateblue', label='envelope')
             plt.legend()
             plt.show()
             plt.close()
         
-        return ret * self._params['mag'] + y * (1 - self._params['mag'])
+        return ret
+
+    def stream(self, y: np.ndarray, offset: int = 0):
+        return self.forward(y, offset=offset)
+
+    def clone(self):
+        return LoopySidechain(**{k: v for k, v in self._params.items() if k != 'name'})
 
 
 class LoopyBalance(LoopyEffect):
@@ -153,6 +222,12 @@ class LoopyBalance(LoopyEffect):
     def reset(self):
         self.gain.reset()
 
+    def plugin(self):
+        return self.gain
+
+    def clone(self):
+        return LoopyBalance(self._params['db'])
+
 
 class LoopyLimiter(LoopyEffect):
     def __init__(self,
@@ -170,6 +245,12 @@ class LoopyLimiter(LoopyEffect):
     def reset(self):
         self.limiter.reset()
 
+    def plugin(self):
+        return self.limiter
+
+    def clone(self):
+        return LoopyLimiter(self._params['thres'])
+
 
 class LoopyCompressor(LoopyEffect):
     def __init__(self,
@@ -198,6 +279,17 @@ class LoopyCompressor(LoopyEffect):
     def reset(self):
         self.compressor.reset()
 
+    def plugin(self):
+        return self.compressor
+
+    def clone(self):
+        return LoopyCompressor(
+            thres=self._params['thres'],
+            ratio=self._params['ratio'],
+            attack_ms=self._params['attack'],
+            release_ms=self._params['release'],
+        )
+
 
 class LoopyDist(LoopyEffect):
     def __init__(self,
@@ -214,6 +306,12 @@ class LoopyDist(LoopyEffect):
 
     def reset(self):
         self.dist.reset()
+
+    def plugin(self):
+        return self.dist
+
+    def clone(self):
+        return LoopyDist(self._params['drive'])
         
 
 
@@ -237,6 +335,95 @@ class LoopyDelay(LoopyEffect):
     def reset(self):
         self.delay.reset()
 
+    def plugin(self):
+        return self.delay
+
+    def clone(self):
+        return LoopyDelay(
+            delay_seconds=self._params['delay_seconds'],
+            feedback=self._params['feedback'],
+            mix=self._params['mix'],
+        )
+
+
+class LoopyGain(LoopyEffect):
+    def __init__(self,
+        db: float = 0.0,  # unit is dB
+        inplace: bool = False,
+    ) -> None:
+        """
+        A scalar gain computed in NumPy, the stateless counterpart of LoopyBalance used by optimize_effects.
+        Args:
+            db (float, optional): gain in dB. Defaults to 0.
+            inplace (bool, optional): scale the input buffer itself, only safe on buffers produced inside the chain. Defaults to False.
+        """
+        super().__init__()
+        self.add_param('name', 'gain')
+        self.add_param('db', db)
+        self._inplace = inplace
+
+    def forward(self, y: np.ndarray):
+        amp = y.dtype.type(db2amp(self._params['db']))
+        if self._inplace and y.flags.writeable:
+            return np.multiply(y, amp, out=y)
+        return y * amp
+
+    def clone(self):
+        return LoopyGain(self._params['db'], self._inplace)
+
+
+# gains commute with these (linear, time-invariant or, for the sidechain, a per-sample envelope)
+LINEAR_EFFECTS = (LoopyHighpass, LoopyLowpass, LoopyReverb, LoopyDelay, LoopySidechain)
+GAIN_EFFECTS = (LoopyBalance, LoopyGain)
+
+
+def optimize_effects(effects: List[LoopyEffect]):
+    """
+    Rewrite a chain of effects into a cheaper one with the same output up to float rounding:
+    gains (LoopyBalance, LoopyGain) are moved across linear stages (filters, reverb, delay, sidechain)
+    up to the next non-linear stage (compressor, limiter, distortion) or the end of the chain,
+    merged into a single NumPy gain, and dropped if the sum is 0 dB.
+    Args:
+        effects (List[LoopyEffect]): the chain.
+    Returns:
+        effects (List[LoopyEffect]): the optimized chain, sharing every effect but the gains.
+        rewrites (List[str]): the rewrites applied, for auditing.
+    """
+    ret, rewrites = [], []
+    pending = []  # (index in the chain, effect, length of ret when it was met)
+
+    def describe(i, fx):
+        return f"{fx._params['name']}({fx._params['db']} dB)@{i}"
+
+    def flush():
+        if not pending:
+            return
+        db = sum(fx._params['db'] for _, fx, _ in pending)
+        for i, fx, pos in pending:
+            if pos < len(ret):
+                rewrites.append(f"move {describe(i, fx)} across {', '.join(stage._params['name'] for stage in ret[pos:])}")
+        if len(pending) > 1:
+            rewrites.append(f"merge {' + '.join(describe(i, fx) for i, fx, _ in pending)} into one gain of {db} dB")
+        if db == 0:
+            rewrites.append(f"drop {' + '.join(describe(i, fx) for i, fx, _ in pending)} (0 dB)")
+        else:
+            # buffers returned by pedalboard and by the sidechain are fresh, scaling them in-place is safe
+            inplace = len(ret) > 0 and (ret[-1].plugin() is not None or isinstance(ret[-1], (LoopySidechain, LoopyGain)))
+            if len(pending) == 1 and isinstance(pending[0][1], LoopyBalance):
+                rewrites.append(f"run {describe(*pending[0][:2])} as a NumPy gain")
+            ret.append(LoopyGain(db, inplace=inplace))
+        pending.clear()
+
+    for i, fx in enumerate(effects):
+        if isinstance(fx, GAIN_EFFECTS):
+            pending.append((i, fx, len(ret)))
+            continue
+        if not isinstance(fx, LINEAR_EFFECTS):
+            flush()
+        ret.append(fx)
+    flush()
+    return ret, rewrites
+
 
 def dict2fx(info: Dict) -> LoopyEffect:
     ret = LoopyEffect()
@@ -0,0 +1,93 @@
+import numpy as np
+import os
+from loopy.utils import DEFAULT_SR
+
+FEATURE_KINDS = ('stft', 'mel')
+
+
+def spectrogram(
+    y: np.ndarray,
+    sr: int = DEFAULT_SR,
+    kind: str = 'stft',
+    n_fft: int = 4096,
+    hop_length: int = None,
+    n_mels: int = 128,
+    top_db: float = 80.0,
+):
+    """
+    Log-power spectrogram of every channel of a waveform, computed in one batched call.
+    Args:
+        y (np.ndarray): the waveform of shape (num_samples, num_channels).
+        sr (int, optional): sample rate of the waveform. Defaults to 44100.
+        kind (str, optional): 'stft' (linear frequency bins) or 'mel'. Defaults to 'stft'.
+        n_fft (int, optional): FFT size. Defaults to 4096.
+        hop_length (int, optional): hop between frames. Defaults to None (n_fft // 4).
+        n_mels (int, optional): number of mel bands (kind='mel' only). Defaults to 128.
+        top_db (float, optional): dynamic range kept below the peak of each channel. Defaults to 80.
+    Returns:
+        S (np.ndarray): power in dB relative to the peak of each channel, of shape (num_channels, num_bins, num_frames), low frequencies first.
+    """
+    import librosa
+
+    if kind not in FEATURE_KINDS:
+        raise ValueError(f'unknown feature kind {kind}, expected one of {FEATURE_KINDS}')
+    # librosa treats leading axes as channels
+    if y.ndim == 2:
+        y = np.ascontiguousarray(np.transpose(y))
+    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))**2
+    if kind == 'mel':
+        S = librosa.feature.melspectrogram(S=S, sr=sr, n_fft=n_fft, n_mels=n_mels)
+    # same as librosa.power_to_db(S, ref=np.max) applied to each channel on its own
+    ref = np.max(S, axis=(-2, -1), keepdims=True)
+    S = 10 * np.log10(np.maximum(S, 1e-10)) - 10 * np.log10(np.maximum(ref, 1e-10))
+    return np.maximum(S, -top_db).astype(np.float32)
+
+
+def _interp_axis(x: np.ndarray, pos: np.ndarray, axis: int):
+    # linear interpolation of x at fractional indices pos along axis
+    pos = np.clip(pos, 0, x.shape[axis] - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, x.shape[axis] - 1)
+    w = (pos - lo).astype(x.dtype)
+    shape = [1] * x.ndim
+    shape[axis] = -1
+    w = w.reshape(shape)
+    return np.take(x, lo, axis=axis) * (1 - w) + np.take(x, hi, axis=axis) * w
+
+
+def resize(x: np.ndarray, shape: tuple, log_freq: bool = False):
+    """
+    Bilinear resize of the last two axes (bins, frames).
+    Args:
+        x (np.ndarray): features of shape (..., num_bins, num_frames).
+        shape (tuple): target (num_bins, num_frames).
+        log_freq (bool, optional): place the target bins on a log-frequency axis, skipping the DC bin (as a log-scaled plot does). Defaults to False.
+    Returns:
+        x (np.ndarray): features of shape (..., shape[0], shape[1]).
+    """
+    num_bins, num_frames = x.shape[-2:]
+    if log_freq:
+        row_pos = np.geomspace(1, num_bins - 1, shape[0])
+    else:
+        row_pos = np.linspace(0, num_bins - 1, shape[0])
+    x = _interp_axis(x, row_pos, axis=x.ndim-2)
+    return _interp_axis(x, np.linspace(0, num_frames - 1, shape[1]), axis=x.ndim-1)
+
+
+def to_image(x: np.ndarray, top_db: float = 80.0):
+    """
+    Map dB features (at most 0) to 8-bit grayscale rows, high frequencies on top.
+    """
+    x = np.clip((x + top_db) / top_db, 0, 1)
+    return np.round(255 * x[..., ::-1, :]).astype(np.uint8)
+
+
+def save_feature(x: np.ndarray, path: str, top_db: float = 80.0):
+    """
+    Save a single-channel feature of shape (num_bins, num_frames) as .npy, or as an image (.png, .jpg) through PIL.
+    """
+    if os.path.splitext(path)[1].lower() == '.npy':
+        np.save(path, x)
+        return
+    from PIL import Image
+    Image.fromarray(to_image(x, top_db)).save(path)
@@ -1,4 +1,3 @@
-import librosa
 import soundfile as sf
 from loopy.utils import preview_wave, PIANO_KEYS, DEFAULT_SR, PRESET_DIR, find_preset
 import os
@@ -6,9 +5,17 @@ import numpy as np
 from typing import List
 import warnings
 from loopy.effect import LoopyBalance
+from loopy.cache import LoopyCache, readonly as _readonly
+from loopy import store
 
 
 LOAD_BPM = 64
+# parsed note banks shared by every LoopyPreset in the process, keyed by (resolved path, sr, load_bpm)
+PRESET_CACHE = LoopyCache('preset', max_bytes=1 << 30)
+# a track only uses a handful of (ADSR, note value, bpm) combinations
+ENVELOPE_CACHE = LoopyCache('envelope', max_items=1024)
+# rendered notes shared by every pattern in the process, see LoopyPreset.note_key
+NOTE_CACHE = LoopyCache('note', max_bytes=1 << 28)
 
 """def modify_preset_dir(target_dir: str):
     print(f'Cautious: the preset folder path has been changed from {PRESET_DIR} to {target_dir}')
@@ -18,6 +25,63 @@ def modify_load_bpm(target_bpm: int):
     print(f'Cautious: the BPM for preset loading has been changed from {LOAD_BPM} to {target_bpm}')
     LOAD_BPM = target_bpm"""
 
+def adsr_envelope(
+    attack: int,  # unit is ms
+    decay: int,  # unit is ms
+    sustain: float,  # between 0 and 1
+    release: int,  # unit is ms
+    note_value: float,  # e.g. 1/4, 1/8, 1/16, etc.
+    bpm: int,
+    sig: str = '4/4',
+    sr: int = DEFAULT_SR,
+):
+    """
+    Build an ADSR envelope.
+
+    Returns:
+        e (np.ndarray): the read-only envelope.
+        num_samples (int): length of the envelope.
+    """
+    # https://en.wikipedia.org/wiki/Envelope_(music)
+    beat_value = 1 / float(sig[-1])  # 4/4 means 1 quarter note receives 1 beat
+    sec_per_beat = 60 / bpm
+    num_sec_ads = sec_per_beat * note_value / beat_value
+    num_sec_max = 60 / LOAD_BPM - release / 1000
+    if num_sec_ads > num_sec_max:
+        num_sec_ads = num_sec_max
+        warnings.warn('Requested note length is not exceeds the maxmimum length of this preset.')
+
+    # 60 / LOAD_BPM since the maximum length of the preset for each note is 1 beat
+    num_sec_a = attack / 1000
+    num_sec_d = decay / 1000
+    num_sec_s = num_sec_ads - num_sec_a - num_sec_d
+    num_sec_r = release / 1000
+
+    num_sec_tot = num_sec_ads + num_sec_r  # (a+d+s)+r
+
+    if min(num_sec_a, num_sec_d, num_sec_s, num_sec_r) < 0:
+        raise KeyError("Length of part of ADSR is negative")
+
+    p1_idx = int(num_sec_a*sr)
+    p2_idx = int((num_sec_a+num_sec_d)*sr)
+    p3_idx = int((num_sec_a+num_sec_d+num_sec_s)*sr)
+    p4_idx = int(num_sec_tot*sr)
+
+    # same arithmetic (and operation order) as the per-sample definition, one segment at a time
+    e = np.zeros(p4_idx)
+    i = np.arange(p4_idx)
+    # attack
+    e[:p1_idx] = i[:p1_idx] / p1_idx
+    # decay
+    e[p1_idx:p2_idx] = 1 - (1-sustain) * (i[p1_idx:p2_idx]-p1_idx) / (p2_idx-p1_idx)
+    # sustain
+    e[p2_idx:p3_idx] = sustain
+    # release
+    e[p3_idx:] = sustain - sustain * (i[p3_idx:]-p3_idx) / (p4_idx-p3_idx)
+
+    return _readonly(e), p4_idx
+
+
 class LoopyPreset():
     def __init__(self,
         source_path: str,
@@ -25,17 +89,38 @@ class LoopyPreset():
         name: str = None,
         load_bpm: int = LOAD_BPM,
         balance_db: float = 0,
+        store_dir: str = None,
     ) -> None:
+        """
+        Args:
+            source_path (str): path to the preset wave (88 notes, one per beat at load_bpm).
+            sr (int, optional): sample rate. Defaults to 44100.
+            name (str, optional): name of the preset. Defaults to None.
+            load_bpm (int, optional): BPM the preset was recorded at. Defaults to 64.
+            balance_db (float, optional): gain applied to every note. Defaults to 0.
+            store_dir (str, optional): directory of compiled presets (see loopy.store). Defaults to store.PRESET_STORE_DIR.
+        """
         self._sr = sr
         self._source_path = find_preset(source_path, PRESET_DIR)
-        y, _ = librosa.load(self._source_path, sr=sr, mono=False)
-        self._y = np.transpose(y, axes=(1, 0))
         self._name = source_path if name is None else name
+        self._store_dir = store_dir if store_dir is not None else store.PRESET_STORE_DIR
         self._load_bpm = load_bpm
         self._balance_db = balance_db
         self._balance = LoopyBalance(balance_db)
 
+        self._cache_key = (os.path.realpath(self._source_path), sr, load_bpm)
+        self._y, self._raw_notes = PRESET_CACHE.get_or_create(self._cache_key, self.load)
+
+    def load(self):
+        if self._store_dir is not None:
+            # already decoded and resampled, memory-mapped read-only
+            self._y = store.open_preset(self._source_path, self._store_dir, self._sr, self._load_bpm)
+        else:
+            import librosa
+            y, _ = librosa.load(self._source_path, sr=self._sr, mono=False)
+            self._y = _readonly(np.transpose(y, axes=(1, 0)))
         self.parse()
+        return (self._y, self._raw_notes), self._y.nbytes
 
     def parse(self):
         self._raw_notes = {}
@@ -55,46 +140,12 @@ class LoopyPreset():
         bpm: int,
         sig: str = '4/4',
     ):
-        # https://en.wikipedia.org/wiki/Envelope_(music)
-        beat_value = 1 / float(sig[-1])  # 4/4 means 1 quarter note receives 1 beat
-        sec_per_beat = 60 / bpm
-        num_sec_ads = sec_per_beat * note_value / beat_value
-        num_sec_max = 60 / LOAD_BPM - release / 1000
-        if num_sec_ads > num_sec_max:
-            num_sec_ads = num_sec_max
-            warnings.warn('Requested note length is not exceeds the maxmimum length of this preset.')
-
-        # 60 / LOAD_BPM since the maximum length of the preset for each note is 1 beat
-        num_sec_a = attack / 1000
-        num_sec_d = decay / 1000
-        num_sec_s = num_sec_ads - num_sec_a - num_sec_d
-        num_sec_r = release / 1000
-
-        num_sec_tot = num_sec_ads + num_sec_r  # (a+d+s)+r
-
-        if min(num_sec_a, num_sec_d, num_sec_s, num_sec_r) < 0:
-            raise KeyError("Length of part of ADSR is negative")
-
-        p1_idx = int(num_sec_a*self._sr)
-        p2_idx = int((num_sec_a+num_sec_d)*self._sr)
-        p3_idx = int((num_sec_a+num_sec_d+num_sec_s)*self._sr)
-        p4_idx = int(num_sec_tot*self._sr)
-
-        e = np.zeros(p4_idx)
-        # attack
-        for i in range(0, p1_idx):
-            e[i] = i / p1_idx
-        # decay
-        for i in range(p1_idx, p2_idx):
-            e[i] = 1 - (1-sustain) * (i-p1_idx) / (p2_idx-p1_idx)
-        # sustain
-        for i in range(p2_idx, p3_idx):
-            e[i] = sustain
-        # release
-        for i in range(p3_idx, p4_idx):
-            e[i] = sustain - sustain * (i-p3_idx) / (p4_idx-p3_idx)
-
-        return e, p4_idx
+        def build():
+            e, num_samples = adsr_envelope(attack, decay, sustain, release, note_value, bpm, sig, self._sr)
+            return (e, num_samples), e.nbytes
+
+        key = (attack, decay, sustain, release, note_value, bpm, sig, self._sr)
+        return ENVELOPE_CACHE.get_or_create(key, build)
 
     def render(self,
         key_name: str,  # C5, A#6, etc.
@@ -108,9 +159,54 @@ class LoopyPreset():
         preview: bool = False,
         debug: bool = False,
         balance_db: float = None,
+        dtype: np.dtype = np.float32,
+    ):
+        if preview or debug:
+            return self.synthesize(key_name, note_value, attack, decay, sustain, release, bpm, sig, preview, debug, balance_db, dtype)
+
+        def build():
+            ret = _readonly(self.synthesize(key_name, note_value, attack, decay, sustain, release, bpm, sig, balance_db=balance_db, dtype=dtype))
+            return ret, ret.nbytes
+
+        key = self.note_key(key_name, note_value, attack, decay, sustain, release, bpm, sig, balance_db, dtype)
+        return NOTE_CACHE.get_or_create(key, build)
+
+    def note_key(self,
+        key_name: str,
+        note_value: float,
+        attack: int,
+        decay: int,
+        sustain: float,
+        release: int,
+        bpm: int,
+        sig: str = '4/4',
+        balance_db: float = None,
+        dtype: np.dtype = np.float32,
+    ):
+        """
+        Identifies a rendered note. Presets loaded from the same file share their note bank,
+        so the key uses the preset's (path, sr, load_bpm) rather than the object itself.
+        """
+        balance_db = self._balance_db if balance_db is None else balance_db
+        return (self._cache_key, key_name, note_value, attack, decay, sustain, release, bpm, sig, balance_db, np.dtype(dtype))
+
+    def synthesize(self,
+        key_name: str,  # C5, A#6, etc.
+        note_value: float,  # e.g. 1/4, 1/8, 1/16, etc.
+        attack: int,  # unit is ms
+        decay: int,  # unit is ms
+        sustain: float,  # between 0 and 1
+        release: int,  # unit is ms
+        bpm: int,
+        sig: str = '4/4',
+        preview: bool = False,
+        debug: bool = False,
+        balance_db: float = None,
+        dtype: np.dtype = np.float32,
     ):
         e, num_samples = self.envelope(attack, decay, sustain, release, note_value, bpm, sig)
-        y = self._raw_notes[key_name][:num_samples, :]
+        e = e.astype(dtype, copy=False)
+        y = self._raw_notes[key_name][:num_samples, :].astype(dtype, copy=False)
         # then apply the envelope to the original waveform
         ret = y * np.expand_dims(e, -1)
         if preview:
@@ -125,11 +221,15 @@ class LoopyPreset():
             plt.show()
             plt.close()
 
-        if balance_db is not None:
-            balance = LoopyBalance(balance_db)
-            return balance(ret)
+        if balance_db is None or balance_db == self._balance_db:
+            balance_db, balance = self._balance_db, self._balance
         else:
-            return self._balance(ret)
+            balance = LoopyBalance(balance_db)
+        if balance_db == 0:
+            # the default 0 dB balance is an identity, skip the pedalboard round trip
+            return ret.astype(dtype, copy=False)
+        # pedalboard always returns float32
+        return balance(ret).astype(dtype, copy=False)
         # return ret
 
     def __dict__(self):
@@ -143,6 +243,10 @@ class LoopyPreset():
     
 
 class LoopyNote():
+    # notes live as rows of the note table of LoopyPatternCore, LoopyPatternCore.notes() returns snapshots of the rows:
+    # changing a snapshot does not change the pattern, edit it with add_note(s), octave_shift and filter
+    __slots__ = ('_key_name', '_note_value', '_pos_in_pattern', '_generator', '_attack', '_decay', '_sustain', '_release')
+
     def __init__(self,
         key_name: str,
         note_value: float,
@@ -167,6 +271,7 @@ class LoopyNote():
         bpm: int,
         sig: str = '4/4',
         balance_db: float = None,
+        dtype: np.dtype = np.float32,
     ):
         return self._generator.render(
             key_name=self._key_name,
@@ -177,6 +282,28 @@ class LoopyNote():
             release=self._release,
             bpm=bpm, sig=sig,
             balance_db=balance_db,
+            dtype=dtype,
+        )
+
+    def render_key(self,
+        bpm: int,
+        sig: str = '4/4',
+        balance_db: float = None,
+        dtype: np.dtype = np.float32,
+    ):
+        """
+        Notes with equal keys render to the same waveform.
+        """
+        return self._generator.note_key(
+            key_name=self._key_name,
+            note_value=self._note_value,
+            attack=self._attack,
+            decay=self._decay,
+            sustain=self._sustain,
+            release=self._release,
+            bpm=bpm, sig=sig,
+            balance_db=balance_db,
+            dtype=dtype,
         )
 
     def short_info(self):
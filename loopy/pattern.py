@@ -1,10 +1,25 @@
 import numpy as np
 from loopy.generator import LoopyPreset, LoopyNote, PRESET_DIR
-from loopy.utils import parse_sig, beat2index, add_y, DEFAULT_SR, preview_wave
+from loopy.utils import parse_sig, beat2index, beats2indices, add_y, add_y_batch, DEFAULT_SR, preview_wave
+from loopy.utils import PIANO_KEYS, PIANO_KEY2MIDI, octave_shift_midi
 from loopy.channel import LoopyChannel
+from loopy.cache import readonly as _readonly
 import os
 from typing import List, Tuple
 from math import ceil
+import threading
+
+# columns of the note table of LoopyPatternCore, one row per note
+NOTE_COLUMNS = {
+    'midi_id': np.int64,
+    'note_value': np.float64,
+    'pos': np.float64,  # unit is beat
+    'generator_id': np.int64,  # insertion order of the generator in the pattern
+    'attack': np.int64,  # unit is ms
+    'decay': np.int64,  # unit is ms
+    'sustain': np.float64,  # between 0 and 1
+    'release': np.int64,  # unit is ms
+}
 
 class LoopyPatternCore():
     def __init__(self,
@@ -14,6 +29,7 @@ class LoopyPatternCore():
         sr: int = DEFAULT_SR,
         sig: str = '4/4',
         resolution: float = 1/16,
+        cache: bool = True,
     ) -> None:
         """
         Defines the skeleton of a pattern.
@@ -24,6 +40,7 @@ class LoopyPatternCore():
             sr (int, optional): sample rate. Defaults to 44100.
             sig (str, optional): signature. Defaults to '4/4'.
             resolution (float, optional): length of the shortest note. Defaults to 1/16.
+            cache (bool, optional): keep the last rendered buffer until the notes change. Defaults to True.
         """
         self._bpm = bpm
         self._name = name
@@ -31,10 +48,27 @@ class LoopyPatternCore():
         self._sr = sr
         self._sig = sig
         self._beats_per_bar, self._beat_value = parse_sig(sig)
-        self._generators = set()
-        self._notes = []
+        self._generators = dict()  # LoopyPreset -> generator id, insertion-ordered
+        self._table = {name: np.empty(0, dtype=dtype) for name, dtype in NOTE_COLUMNS.items()}
+        self._pending = []  # rows added since the table was last built, see table()
         self._tot_samples = int(self._num_bars * self._beats_per_bar * 60 * sr / bpm)
         self._resolution = resolution
+        self._cache = cache
+        self._rendered = None
+        self._events = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """
+        Drop the cached render, e.g. after changing a generator used by this pattern.
+        """
+        self._rendered = None
+        self._events = None
+
+    def generator_id(self, generator: LoopyPreset):
+        if generator not in self._generators:
+            self._generators[generator] = len(self._generators)
+        return self._generators[generator]
 
     def add_note(self,
         key_name: str,
@@ -46,18 +80,8 @@ class LoopyPatternCore():
         sustain: float = 1.0,  # between 0 and 1
         release: int = 0,  # unit is ms
     ):
-        note = LoopyNote(
-            key_name=key_name,
-            note_value=note_value,
-            pos_in_pattern=pos_in_pattern,
-            generator=generator,
-            attack=attack,
-            decay=decay,
-            sustain=sustain,
-            release=release,
-        )
-        self._notes.append(note)
-        self._generators.add(generator)
+        self._pending.append((PIANO_KEY2MIDI[key_name], note_value, pos_in_pattern, self.generator_id(generator), attack, decay, sustain, release))
+        self.invalidate()
 
     def add_notes(self,
         notes: List[Tuple[str, float, float]],
@@ -67,30 +91,142 @@ class LoopyPatternCore():
         sustain: float = 1.0,  # between 0 and 1
         release: int = 0,  # unit is ms
     ):
-        for key_name, note_value, pos_in_pattern in notes:
-            self.add_note(
-                key_name=key_name,
-                note_value=note_value,
-                pos_in_pattern=pos_in_pattern,
-                generator=generator,
-                attack=attack,
-                decay=decay,
-                sustain=sustain,
-                release=release,
-            )
-
-    def render(self):
-        y = np.zeros((self._tot_samples, 2))
-        for note in self._notes:
-            st_index = beat2index(note._pos_in_pattern, bpm=self._bpm, sr=self._sr)
-            note_y = note.render(bpm=self._bpm, sig=self._sig)
-            ### print(st_index, note_y.shape)
-            add_y(y, note_y, st_index)
+        generator_id = self.generator_id(generator)
+        self._pending += [
+            (PIANO_KEY2MIDI[key_name], note_value, pos_in_pattern, generator_id, attack, decay, sustain, release)
+            for key_name, note_value, pos_in_pattern in notes
+        ]
+        self.invalidate()
+
+    def table(self):
+        """
+        Returns:
+            table (Dict[str, np.ndarray]): the note table, one array per column of NOTE_COLUMNS, in insertion order.
+        """
+        if self._pending:
+            columns = list(zip(*self._pending))
+            self._table = {
+                name: np.concatenate([self._table[name], np.array(column, dtype=dtype)])
+                for (name, dtype), column in zip(NOTE_COLUMNS.items(), columns)
+            }
+            self._pending = []
+        return self._table
 
+    def __len__(self):
+        return len(self._table['midi_id']) + len(self._pending)
+
+    def notes(self, note_ids: np.ndarray = None):
+        """
+        Args:
+            note_ids (np.ndarray, optional): rows of the note table. Defaults to None (every note).
+        Returns:
+            notes (List[LoopyNote]): read-only snapshots of the notes, changing them does not change the pattern.
+        """
+        table = self.table()
+        generators = list(self._generators)
+        if note_ids is None:
+            note_ids = np.arange(len(table['midi_id']))
+        rows = zip(*[table[name][note_ids].tolist() for name in NOTE_COLUMNS])
+        return [
+            LoopyNote(PIANO_KEYS[midi_id-21], note_value, pos, generators[generator_id], attack, decay, sustain, release)
+            for midi_id, note_value, pos, generator_id, attack, decay, sustain, release in rows
+        ]
+
+    @property
+    def _notes(self):
+        # a tuple, so that code appending to the old note list fails instead of being ignored
+        return tuple(self.notes())
+
+    def octave_shift(self, delta: int, generator: LoopyPreset = None):
+        """
+        Shift the notes (of one generator) by octaves, as utils.octave_shift does for key names.
+        """
+        table = self.table()
+        mask = slice(None) if generator is None else table['generator_id'] == self._generators[generator]
+        table['midi_id'][mask] = octave_shift_midi(table['midi_id'][mask], delta)
+        self.invalidate()
+
+    def filter(self, mask: np.ndarray):
+        """
+        Keep the notes where mask (over the rows of the note table) is True, e.g. core.filter(core.table()['pos'] < 16).
+        """
+        table = self.table()
+        self._table = {name: column[mask] for name, column in table.items()}
+        self.invalidate()
+
+    def events(self):
+        """
+        Notes grouped by rendered waveform, with their start indices.
+        Returns:
+            group_notes (List[LoopyNote]): one representative note per distinct waveform.
+            note_ids (np.ndarray): group of each note.
+            st_indices (np.ndarray): start index of each note.
+        """
+        if self._events is None:
+            # notes sharing a rendered waveform (same preset, key, value and ADSR) are rendered once
+            table = self.table()
+            keys = np.stack([table[name].astype(np.float64) for name in NOTE_COLUMNS if name != 'pos'], axis=1)
+            _, first_ids, note_ids = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+            # number the groups by first appearance
+            order = np.argsort(first_ids, kind='stable')
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            note_ids = rank[note_ids.reshape(-1)].astype(np.int64)
+            st_indices = beats2indices(table['pos'], bpm=self._bpm, sr=self._sr)
+            self._events = (self.notes(first_ids[order]), note_ids, st_indices)
+        return self._events
+
+    def render_range(self, st_index: int, ed_index: int, dtype: np.dtype = np.float32):
+        """
+        Render samples [st_index, ed_index) of the pattern, touching only the notes that overlap them.
+        Args:
+            st_index (int): first sample.
+            ed_index (int): one past the last sample.
+            dtype (np.dtype, optional): precision of the buffer. Defaults to np.float32.
+        Returns:
+            y (np.ndarray): the waveform of shape (ed_index - st_index, 2).
+        """
+        y = np.zeros((ed_index - st_index, 2), dtype=dtype)
+        group_notes, note_ids, st_indices = self.events()
+        if len(group_notes) == 0:
+            return y
+        note_ys = [note.render(bpm=self._bpm, sig=self._sig, dtype=dtype) for note in group_notes]
+        note_lens = np.array([note_y.shape[0] for note_y in note_ys], dtype=np.int64)
+        # insertion order is kept, so overlapping notes are summed exactly as in a full render
+        mask = (st_indices < ed_index) & (st_indices + note_lens[note_ids] > st_index)
+        add_y_batch(y, note_ys, note_ids[mask], st_indices[mask] - st_index, empty_target=True)
         return y
 
+    def render(self, dtype: np.dtype = np.float32):
+        # placements of the same core may be rendered from several threads, synthesize once
+        with self._lock:
+            if self._rendered is not None and self._rendered.dtype == dtype:
+                return self._rendered
+
+            y = self.render_range(0, self._tot_samples, dtype)
+
+            if self._cache:
+                # shared with every caller, so it must not be modified in-place
+                self._rendered = _readonly(y)
+            return y
+
     def __dict__(self):
-        return {'notes': [note.__dict__() for note in self._notes]}
+        table = self.table()
+        names = [generator._name for generator in self._generators]
+        columns = [table[name].tolist() for name in NOTE_COLUMNS]
+        return {'notes': [
+            {
+                'key_name': PIANO_KEYS[midi_id-21],
+                'note_value': note_value,
+                'pos_in_pattern': pos,
+                'generator': names[generator_id],
+                'attack': attack,
+                'decay': decay,
+                'sustain': sustain,
+                'release': release,
+            }
+            for midi_id, note_value, pos, generator_id, attack, decay, sustain, release in zip(*columns)
+        ]}
     
     
 class LoopyPattern():
@@ -113,11 +249,11 @@ class LoopyPattern():
         self._core = core
         self._local_pos = local_pos
         
-    def render(self):
+    def render(self, dtype: np.dtype = np.float32):
         if self._channel is None:
-            return self._core.render()
+            return self._core.render(dtype)
         else:
-            return self._channel(self._core.render())
+            return self._channel(self._core.render(dtype))
 
     def __dict__(self):
         return {
@@ -3,11 +3,9 @@ from loopy.pattern import preview_notes
 from loopy.effect import *
 from loopy.utils import *
 from loopy.rhythm import LoopyRhythm, trivial_accomp
-from copy import deepcopy
 import os
 from typing import List, Tuple
 import random
-import matplotlib.pyplot as plt
 
 class LoopyStyleBase():
     def __init__(self) -> None:
@@ -53,7 +51,8 @@ def compose(
         core = LoopySampleCore(style_info['source_path'])
         channel = LoopyChannel(
             name=style_info['source_path'],
-            effects=[LoopyBalance(style_info['gain'])]
+            effects=[LoopyBalance(style_info['gain'])],
+            part='kick',
         )
         for global_pos in range(num_bars):
             if (global_pos + 1) % style_info['blank_every'] == 0:  # blank convention every 8 bars
@@ -70,7 +69,8 @@ def compose(
         core = LoopySampleCore(style_info['source_path'], truncate=4)  # 4 beats as a whole
         channel = LoopyChannel(
             name=style_info['source_path'],
-            effects=[LoopyHighpass(style_info['highpass']), LoopyBalance(style_info['gain'])]
+            effects=[LoopyHighpass(style_info['highpass']), LoopyBalance(style_info['gain'])],
+            part='top',
         )
         for global_pos in range(num_bars):
             if (global_pos + 1) % style_info['blank_every'] == 0:  # blank convention every 8 bars
@@ -86,7 +86,8 @@ def compose(
         if style_info['type'] == 'main-fill':
             channel = LoopyChannel(
                 name='main-fill',
-                effects=[LoopyHighpass(style_info['highpass']), LoopyBalance(style_info['gain'])]
+                effects=[LoopyHighpass(style_info['highpass']), LoopyBalance(style_info['gain'])],
+                part='fx',
             )
             for i in range(0, num_bars, style_info['every']):
                 source_name = random.choice(os.listdir(style_info['dir']))
@@ -106,7 +107,8 @@ def compose(
                     LoopyHighpass(style_info['highpass']),
                     LoopyBalance(style_info['gain']),
                     LoopyReverb(dry_level=style_info['dry'], wet_level=style_info['dry'])
-                ]
+                ],
+                part='fx',
             )
             f = lambda n:n&-n  # find the largest power of 2 that divides global_pos
             for global_pos in range(num_bars):
@@ -126,7 +128,8 @@ def compose(
         elif style_info['type'] == 'downlifter':
             channel = LoopyChannel(
                 name='downlifter',
-                effects=[LoopyHighpass(style_info['highpass']), LoopyBalance(style_info['gain'])]
+                effects=[LoopyHighpass(style_info['highpass']), LoopyBalance(style_info['gain'])],
+                part='fx',
             )
             source_names = random.sample(os.listdir(style_info['dir']), style_info['num'])
             for i in range(0, num_bars, style_info['every']):
@@ -146,7 +149,8 @@ def compose(
             # print('here')
             channel = LoopyChannel(
                 name='loop',
-                effects=[LoopyHighpass(style_info['highpass']), LoopyBalance(style_info['gain'])]
+                effects=[LoopyHighpass(style_info['highpass']), LoopyBalance(style_info['gain'])],
+                part='fx',
             )
             source_names = random.sample(os.listdir(style_info['dir']), style_info['num'])
             for i in range(num_bars):
@@ -189,11 +193,10 @@ def compose(
             name=info['name'] if info.get('name') else f'LEAD-{i}',
             balance_db=info['gain']
         )
+        cores['lead'].add_notes(lead_notes, generator)
         delta = info.get('octave_shift')
-        notes = deepcopy(lead_notes)
         if delta is not None:
-            notes = [(octave_shift(x, delta), y, z) for x, y, z in notes]
-        cores['lead'].add_notes(notes, generator)
+            cores['lead'].octave_shift(delta, generator)
 
     for i, info in enumerate(style.sound_sheet['chord']):
         if info.get('mute'):
@@ -203,11 +206,10 @@ def compose(
             name=info['name'] if info.get('name') else f'CHORD-{i}',
             balance_db=info['gain']
         )
+        cores['chord'].add_notes(chord_notes, generator)
         delta = info.get('octave_shift')
-        notes = deepcopy(chord_notes)
         if delta is not None:
-            notes = [(octave_shift(x, delta), y, z) for x, y, z in notes]
-        cores['chord'].add_notes(notes, generator)
+            cores['chord'].octave_shift(delta, generator)
 
     for i, info in enumerate(style.sound_sheet['bass']):
         if info.get('mute'):
@@ -217,14 +219,10 @@ def compose(
             name=info['name'] if info.get('name') else f'BASS-{i}',
             balance_db=info['gain']
         )
+        cores['bass'].add_notes(bass_notes, generator)
         delta = info.get('octave_shift')
-        notes = deepcopy(bass_notes)
         if delta is not None:
-            notes = [(octave_shift(x, delta), y, z) for x, y, z in notes]
-        ### print(notes)
-        ### print(info['source_path'], set([x for x,y,z in notes]))
-        ### preview_notes(set([x for x,y,z in notes]), preset_name=info['source_path'])
-        cores['bass'].add_notes(notes, generator)
+            cores['bass'].octave_shift(delta, generator)
 
     for i, info in enumerate(style.sound_sheet['sub']):
         if info.get('mute'):
@@ -234,11 +232,10 @@ def compose(
             name=info['name'] if info.get('name') else f'SUB-{i}',
             balance_db=info['gain']
         )
+        cores['sub'].add_notes(sub_notes, generator)
         delta = info.get('octave_shift')
-        notes = deepcopy(sub_notes)
         if delta is not None:
-            notes = [(octave_shift(x, delta), y, z) for x, y, z in notes]
-        cores['sub'].add_notes(notes, generator)
+            cores['sub'].octave_shift(delta, generator)
         """print(notes)
         preview_wave(cores['sub'].render())
         exit()"""
@@ -247,7 +244,7 @@ def compose(
     for part in ('lead', 'chord', 'bass', 'sub'):
         if part in muted_parts:
             continue
-        channels[part] = LoopyChannel(name=part.upper())
+        channels[part] = LoopyChannel(name=part.upper(), part=part)
         for effect_info in style.inst_channel_sheet[part]:
             channels[part].add_effect(dict2fx(effect_info))
         track.add_pattern(cores[part], 0, 0, channels[part])
@@ -1,10 +1,7 @@
 from loopy.utils import parse_sig, find_preset, preview_wave
 from loopy.utils import piano_id2piano_key, piano_key2piano_id
 from loopy.utils import get_chord_notes, octave_shift
-from loopy.template import add_kick
 from loopy import LoopyPatternCore, LoopyPreset, LoopyTrack
-import matplotlib.pyplot as plt
-from matplotlib.collections import LineCollection
 import numpy as np
 import os
 import json
@@ -56,6 +53,7 @@ class LoopyRhythm():
         temp_core.add_notes(notes=notes, generator=temp_gen)
         temp_track.add_pattern(temp_core, 0, 0)
 
+        from loopy.template import add_kick  # deprecated module, only imported when previewing
         add_kick(temp_track, num_bars=tot_bars)
         preview_wave(temp_track.render())
 
@@ -98,6 +96,8 @@ class LoopyRhythm():
             self._place_holders.append((note_value, st_pos, ed_pos))
 
         if debug:
+            import matplotlib.pyplot as plt
+            from matplotlib.collections import LineCollection
             print(self._place_holders)
             segments = [((st_pos, j), (ed_pos, j)) for j, (note_value, st_pos, ed_pos) in enumerate(self._place_holders)]
             fig, ax = plt.subplots()
@@ -176,23 +176,26 @@ def trivial_accomp(
             place_holders += [(1/beats_per_bar, i, i+1)]
 
     score, roots, sub_roots = [], [], []
+    chords = dict()  # chord id -> (key names, root name), a progression only uses a few chords
     i, j = 0, 0
     while i < len(place_holders):
         note_value, st_pos, ed_pos = place_holders[i]
         while chord_prog[j][2] * beats_per_bar < ed_pos and j < len(chord_prog):
             j += 1
         chord_id = chord_prog[j][0]
-        decor_notes = decor_map[chord_id] if chord_id in decor_map.keys() else []
-        key_names, root_name = get_chord_notes(
-            chord_id=chord_id,
-            scale_root=scale_root,
-            scale_type=scale_type,
-            root_area=root_area,
-            del_second=del_second,
-            decr_octave=decr_octave,
-            incr_octave=incr_octave,
-            decor_notes=decor_notes,
-        )
+        if chord_id not in chords:
+            decor_notes = decor_map[chord_id] if chord_id in decor_map.keys() else []
+            chords[chord_id] = get_chord_notes(
+                chord_id=chord_id,
+                scale_root=scale_root,
+                scale_type=scale_type,
+                root_area=root_area,
+                del_second=del_second,
+                decr_octave=decr_octave,
+                incr_octave=incr_octave,
+                decor_notes=decor_notes,
+            )
+        key_names, root_name = chords[chord_id]
         for key_name in key_names:
             score += [(key_name, note_value, st_pos)]
         roots += [(root_name, note_value, st_pos)]
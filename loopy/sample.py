@@ -1,14 +1,18 @@
-import librosa
 import soundfile as sf
-from playsound import playsound
 import os
 import numpy as np
 from loopy.utils import sec2hhmmss, DEFAULT_SR, parse_sig, find_preset
 from loopy.channel import LoopyChannel
 from loopy.effect import LoopyBalance
+from loopy.cache import LoopyCache, readonly as _readonly
+from math import ceil
 
 
 SAMPLE_DIR = 'C:\\Program Files\\Image-Line\\FL Studio 21\\Data\\Patches\\Packs\\Old Packs'
+# decoded (and truncated) samples shared by every LoopySampleCore, keyed by (resolved path, sr, bpm, truncate)
+SAMPLE_CACHE = LoopyCache('sample', max_bytes=1 << 29)
+# extra source frames decoded past the truncation point so that resampling does not see an artificial edge
+RESAMPLE_MARGIN_SEC = 0.05
 
 """def modify_sample_dir(target_dir: str):
     print(f'Cautious: the sample folder path has been changed from {SAMPLE_DIR} to {target_dir}')
@@ -42,20 +46,46 @@ class LoopySampleCore():
         self._balance_db = balance_db
         self._balance = LoopyBalance(balance_db)
 
-        y, _ = librosa.load(self._source_path, sr=sr, mono=False)
-        self._y = np.transpose(y, axes=(1, 0))
-
-        if truncate is not None:
-            lim = int(60 * sr * truncate / bpm)
-            self._y = self._y[:lim, :]
-
         self._sr = sr
+        self._cache_key = (os.path.realpath(self._source_path), sr, bpm, truncate)
+        self._y = SAMPLE_CACHE.get_or_create(self._cache_key, self.load)
         self._length = sec2hhmmss(self._y.shape[0]/self._sr)
         
         self._name = source_path if name is None else name
 
-    def render(self):
-        return self._balance(self._y)
+    def load(self):
+        """
+        Decode the sample, reading only the frames needed by the truncation.
+        Returns:
+            y (np.ndarray): read-only waveform of shape (num_samples, num_channels).
+            nbytes (int): size of the waveform.
+        """
+        lim = None if self._truncate is None else int(60 * self._sr * self._truncate / self._bpm)
+        try:
+            with sf.SoundFile(self._source_path) as f:
+                src_sr = f.samplerate
+                frames = f.frames
+                if lim is not None:
+                    frames = min(frames, ceil(lim * src_sr / self._sr) + int(RESAMPLE_MARGIN_SEC * src_sr))
+                f.seek(0)
+                y = f.read(frames=frames, dtype='float32', always_2d=True)
+            if src_sr != self._sr:
+                import librosa
+                y = np.transpose(librosa.resample(np.transpose(y), orig_sr=src_sr, target_sr=self._sr))
+        except RuntimeError:
+            # formats libsndfile cannot read go through librosa (audioread)
+            import librosa
+            y, _ = librosa.load(self._source_path, sr=self._sr, mono=False)
+            y = np.transpose(np.atleast_2d(y), axes=(1, 0))
+
+        if lim is not None:
+            y = np.array(y[:lim, :])
+        y = _readonly(np.ascontiguousarray(y))
+        return y, y.nbytes
+
+    def render(self, dtype: np.dtype = np.float32):
+        # pedalboard always returns float32
+        return self._balance(self._y).astype(dtype, copy=False)
         # return self._y
 
     def __dict__(self):
@@ -88,11 +118,11 @@ class LoopySample():
         self._core = core
         self._local_pos = local_pos
         
-    def render(self):
+    def render(self, dtype: np.dtype = np.float32):
         if self._channel is None:
-            return self._core.render()
+            return self._core.render(dtype)
         else:
-            return self._channel(self._core.render())
+            return self._channel(self._core.render(dtype))
 
     def __dict__(self):
         return {
@@ -0,0 +1,102 @@
+import numpy as np
+import os
+import json
+from loopy.utils import DEFAULT_SR, db2amp
+from typing import Dict, List
+
+
+class LoopyStems():
+    def __init__(self,
+        stems: Dict[str, np.ndarray],
+        sr: int = DEFAULT_SR,
+        name: str = None,
+        path: str = None,
+    ) -> None:
+        """
+        Post-channel stems of a rendered track, remixed by linear recombination without rendering again.
+        Args:
+            stems (Dict[str, np.ndarray]): part -> waveform of shape (num_samples, 2), before the master gain.
+            sr (int, optional): sample rate. Defaults to 44100.
+            name (str, optional): name of the track. Defaults to None.
+            path (str, optional): keep the stems in a float32 .npy memory map at this path (with a .json next to it). Defaults to None (in memory).
+        """
+        self._parts = list(stems)
+        self._sr = sr
+        self._name = name
+        self._path = path
+        shape = (len(self._parts),) + next(iter(stems.values())).shape if stems else (0, 0, 2)
+        if path is None:
+            self._y = np.empty(shape, dtype=np.float32)
+        else:
+            self._y = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+        for i, stem in enumerate(stems.values()):
+            self._y[i] = stem
+        if path is not None:
+            self._y.flush()
+            with open(os.path.splitext(path)[0]+'.json', 'w') as f:
+                json.dump({'parts': self._parts, 'sr': sr, 'name': name}, f)
+            self._y = np.load(path, mmap_mode='r')
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Open stems saved with a path as a read-only memory map.
+        """
+        with open(os.path.splitext(path)[0]+'.json', 'r') as f:
+            meta = json.load(f)
+        ret = cls(dict(), sr=meta['sr'], name=meta['name'])
+        ret._parts, ret._path = meta['parts'], path
+        ret._y = np.load(path, mmap_mode='r')
+        return ret
+
+    def parts(self):
+        return list(self._parts)
+
+    def __getitem__(self, part: str):
+        return self._y[self._parts.index(part)]
+
+    def __len__(self):
+        return len(self._parts)
+
+    def weights(self,
+        gains: Dict[str, float] = None,
+        mute: List[str] = None,
+        master_gain: float = 7.5,
+    ):
+        """
+        Linear weight of every stem in a mix.
+        Args:
+            gains (Dict[str, float], optional): part -> gain in dB, missing parts stay at 0 dB. Defaults to None.
+            mute (List[str], optional): parts left out of the mix. Defaults to None.
+            master_gain (float, optional): master gain in dB. Defaults to 7.5 (as LoopyTrack.render).
+        Returns:
+            w (np.ndarray): float32 weights of shape (num_stems,).
+        """
+        gains = dict() if gains is None else gains
+        mute = set() if mute is None else set(mute)
+        w = np.array([0.0 if part in mute else db2amp(gains.get(part, 0.0)) for part in self._parts])
+        return (w * db2amp(master_gain)).astype(np.float32)
+
+    def remix(self,
+        gains: Dict[str, float] = None,
+        mute: List[str] = None,
+        master_gain: float = 7.5,
+    ):
+        """
+        Mix the stems with per-stem gains, a mute list and a master gain (see weights) in one multiply-add.
+        With no gains and no mutes this is the mix of LoopyTrack.render_stems up to float rounding.
+        Returns:
+            y (np.ndarray): the waveform of shape (num_samples, 2).
+        """
+        w = self.weights(gains, mute, master_gain)
+        return np.tensordot(w, self._y, axes=1)
+
+    def remix_many(self, weights: np.ndarray):
+        """
+        Mix several variants at once.
+        Args:
+            weights (np.ndarray): linear weights of shape (num_variants, num_stems), rows as returned by weights().
+        Returns:
+            y (np.ndarray): the waveforms of shape (num_variants, num_samples, 2).
+        """
+        return np.tensordot(np.asarray(weights, dtype=np.float32), self._y, axes=1)
@@ -0,0 +1,161 @@
+import numpy as np
+import os
+import json
+import hashlib
+from typing import List, Dict
+from loopy.utils import DEFAULT_SR, PRESET_DIR, find_preset
+
+# directory of compiled presets used by LoopyPreset when no store_dir is given (None disables the store)
+PRESET_STORE_DIR = None
+PRESET_STORE_VERSION = 1
+
+
+def store_paths(source_path: str, store_dir: str, sr: int, load_bpm: int):
+    """
+    Locate the compiled form of a preset.
+    Args:
+        source_path (str): resolved path of the preset wave.
+        store_dir (str): directory of the store.
+        sr (int): target sample rate.
+        load_bpm (int): BPM the preset was recorded at (one note per beat).
+    Returns:
+        npy_path (str): the decoded waveform.
+        meta_path (str): the metadata used for staleness checks.
+    """
+    source_path = os.path.realpath(source_path)
+    digest = hashlib.sha1(source_path.encode('utf-8')).hexdigest()[:12]
+    stem = f'{os.path.splitext(os.path.basename(source_path))[0]}-{digest}-{sr}-{load_bpm}'
+    return os.path.join(store_dir, stem+'.npy'), os.path.join(store_dir, stem+'.json')
+
+
+def note_slots(sr: int, load_bpm: int):
+    # the same split as LoopyPreset.parse: note i occupies beat i
+    return [(int(i*60*sr/load_bpm), int((i+1)*60*sr/load_bpm)) for i in range(88)]
+
+
+def is_fresh(source_path: str, meta_path: str):
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    stat = os.stat(source_path)
+    return meta.get('version') == PRESET_STORE_VERSION \
+        and meta.get('mtime_ns') == stat.st_mtime_ns \
+        and meta.get('size') == stat.st_size
+
+
+def build_preset(
+    source_path: str,
+    store_dir: str,
+    sr: int = DEFAULT_SR,
+    load_bpm: int = 64,
+    force: bool = False,
+):
+    """
+    Decode and resample a preset once and write it to the store, unless the store is up to date.
+    Args:
+        source_path (str): path of the preset wave, already resolved against PRESET_DIR.
+        store_dir (str): directory of the store.
+        sr (int, optional): target sample rate. Defaults to 44100.
+        load_bpm (int, optional): BPM the preset was recorded at. Defaults to 64.
+        force (bool, optional): rebuild even if the store is up to date. Defaults to False.
+    Returns:
+        npy_path (str): path of the compiled preset.
+    """
+    source_path = os.path.realpath(source_path)
+    npy_path, meta_path = store_paths(source_path, store_dir, sr, load_bpm)
+    if not force and os.path.exists(npy_path) and is_fresh(source_path, meta_path):
+        return npy_path
+
+    # only a rebuild decodes, opening a fresh store does not load librosa
+    import librosa
+
+    os.makedirs(store_dir, exist_ok=True)
+    stat = os.stat(source_path)
+    y, _ = librosa.load(source_path, sr=sr, mono=False)
+    y = np.transpose(np.atleast_2d(y), axes=(1, 0))
+    slots = note_slots(sr, load_bpm)
+    y = np.ascontiguousarray(y[:slots[-1][1]])
+
+    # write next to the target and rename, so that concurrent workers never see a partial file
+    tmp_suffix = f'.{os.getpid()}.tmp'
+    with open(npy_path+tmp_suffix, 'wb') as f:
+        np.save(f, y)
+    with open(meta_path+tmp_suffix, 'w') as f:
+        json.dump({
+            'version': PRESET_STORE_VERSION,
+            'source_path': source_path,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sr': sr,
+            'load_bpm': load_bpm,
+            'shape': list(y.shape),
+            'slots': slots,
+        }, f)
+    os.replace(npy_path+tmp_suffix, npy_path)
+    os.replace(meta_path+tmp_suffix, meta_path)
+    return npy_path
+
+
+def compile_preset(
+    source_path: str,
+    store_dir: str,
+    sr: int = DEFAULT_SR,
+    load_bpm: int = 64,
+    force: bool = False,
+):
+    """
+    Compile a preset into the store (see build_preset).
+    Args:
+        source_path (str): path to the preset (relative to PRESET_DIR or absolute).
+    """
+    return build_preset(find_preset(source_path, PRESET_DIR), store_dir, sr, load_bpm, force)
+
+
+def compile_presets(
+    source_paths: List[str],
+    store_dir: str,
+    sr: int = DEFAULT_SR,
+    load_bpm: int = 64,
+    force: bool = False,
+):
+    return [compile_preset(source_path, store_dir, sr, load_bpm, force) for source_path in source_paths]
+
+
+def compile_sound_sheet(
+    sound_sheet: Dict[str, List[Dict]],
+    store_dir: str,
+    sr: int = DEFAULT_SR,
+    load_bpm: int = 64,
+    force: bool = False,
+):
+    """
+    Compile every preset of a style (see LoopyStyleBase.sound_sheet).
+    """
+    source_paths = []
+    for part in ('lead', 'chord', 'bass', 'sub'):
+        for info in sound_sheet.get(part, []):
+            if info['source_path'] not in source_paths:
+                source_paths.append(info['source_path'])
+    return compile_presets(source_paths, store_dir, sr, load_bpm, force)
+
+
+def open_preset(
+    source_path: str,
+    store_dir: str,
+    sr: int = DEFAULT_SR,
+    load_bpm: int = 64,
+):
+    """
+    Open a compiled preset as a read-only memory map, rebuilding it first if it is missing or stale.
+    Pages are shared with every other process that maps the same file.
+    Args:
+        source_path (str): resolved path of the preset wave.
+        store_dir (str): directory of the store.
+        sr (int, optional): target sample rate. Defaults to 44100.
+        load_bpm (int, optional): BPM the preset was recorded at. Defaults to 64.
+    Returns:
+        y (np.memmap): the decoded waveform of shape (num_samples, num_channels).
+    """
+    npy_path = build_preset(os.path.realpath(source_path), store_dir, sr, load_bpm)
+    return np.load(npy_path, mmap_mode='r')
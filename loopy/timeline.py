@@ -0,0 +1,103 @@
+import numpy as np
+from loopy.utils import DEFAULT_SR, pos2indices
+from typing import List
+
+
+class LoopyTimeline():
+    def __init__(self,
+        placements: List,
+        sr: int = DEFAULT_SR,
+        sig: str = '4/4',
+        bpm: int = 128,
+    ) -> None:
+        """
+        Columnar index of the placements (LoopyPattern / LoopySample) of a track, sorted by start.
+        Args:
+            placements (List): placements in track order (patterns, then samples), referred to by their position in this list.
+            sr (int, optional): sample rate. Defaults to 44100.
+            sig (str, optional): signature. Defaults to '4/4'.
+            bpm (int, optional): beats per minutes. Defaults to 128.
+        """
+        self._placements = placements
+        core_ids, channel_ids = dict(), dict()
+        for placement in placements:
+            core_ids.setdefault(placement._core, len(core_ids))
+            channel_ids.setdefault(placement._channel, len(channel_ids))
+        self._cores, self._channels = list(core_ids), list(channel_ids)
+
+        starts = pos2indices(
+            [placement._global_pos for placement in placements],
+            [placement._local_pos for placement in placements],
+            sr=sr, sig=sig, bpm=bpm
+        ).reshape(-1)
+        lengths = np.array([self.core_len(placement._core) for placement in placements], dtype=np.int64)
+        order = np.argsort(starts, kind='stable')
+
+        self._starts, self._ends = starts, starts + lengths  # in placement order
+        self._st = self._starts[order]
+        self._ed = self._ends[order]
+        self._core_ids = np.array([core_ids[placement._core] for placement in placements], dtype=np.int64)[order]
+        self._channel_ids = np.array([channel_ids[placement._channel] for placement in placements], dtype=np.int64)[order]
+        self._placement_ids = order.astype(np.int64)
+        # no event is longer than this, which bounds how far back an overlapping event can start
+        self._max_len = int(lengths.max()) if len(placements) else 0
+
+    @staticmethod
+    def core_len(core):
+        # LoopyPatternCore knows its length, LoopySampleCore holds its waveform
+        return core._tot_samples if hasattr(core, '_tot_samples') else core._y.shape[0]
+
+    def __len__(self):
+        return len(self._placements)
+
+    def starts(self):
+        """
+        Returns:
+            starts (np.ndarray): start index of every placement, in placement order.
+        """
+        return self._starts
+
+    def ends(self):
+        """
+        Returns:
+            ends (np.ndarray): one past the last sample of every placement, in placement order.
+        """
+        return self._ends
+
+    def query(self, st_index: int, ed_index: int):
+        """
+        Placements that overlap samples [st_index, ed_index).
+        Args:
+            st_index (int): first sample.
+            ed_index (int): one past the last sample.
+        Returns:
+            placement_ids (np.ndarray): positions in the placement list, in placement order (the order they are mixed in).
+        """
+        lo = np.searchsorted(self._st, st_index - self._max_len, side='right')
+        hi = np.searchsorted(self._st, ed_index, side='left')
+        mask = self._ed[lo:hi] > st_index
+        return np.sort(self._placement_ids[lo:hi][mask])
+
+    def placements(self, placement_ids: np.ndarray = None):
+        if placement_ids is None:
+            return list(self._placements)
+        return [self._placements[i] for i in placement_ids.tolist()]
+
+    def columns(self):
+        """
+        Returns:
+            columns (Dict[str, np.ndarray]): start/end indices, core/channel ids (see cores() and channels()) and placement ids, sorted by start.
+        """
+        return {
+            'st': self._st,
+            'ed': self._ed,
+            'core_id': self._core_ids,
+            'channel_id': self._channel_ids,
+            'placement_id': self._placement_ids,
+        }
+
+    def cores(self):
+        return list(self._cores)
+
+    def channels(self):
+        return list(self._channels)
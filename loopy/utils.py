@@ -1,5 +1,6 @@
 from datetime import timedelta
-from playsound import playsound
+from functools import lru_cache
+from math import ceil
 import soundfile as sf
 import numpy as np
 from typing import List, Tuple, Dict, Union
@@ -9,6 +10,8 @@ import warnings
 PRESET_DIR = 'C:\\Users\\CA7AX\\LooPy\\presets'
 SAMPLE_DIR = 'C:\\Users\\CA7AX\\LooPy\\samples'
 DEFAULT_SR = 44100
+# placements of a source compared with each other when add_y_batch looks for the spacing it repeats at
+RUN_NEIGHBOURS = 16
 # https://www.inspiredacoustics.com/en/MIDI_note_numbers_and_center_frequencies
 PIANO_KEYS = ['A0', 'A#0', 'B0', 'C0']
 for i in range(1, 8):
@@ -18,6 +21,15 @@ for i in range(1, 8):
         f'A{i}', f'A#{i}', f'B{i}', f'C{i+1}'
     ]
 assert(len(PIANO_KEYS) == 88)
+# key name -> midi id (21-108)
+PIANO_KEY2MIDI = {key: i + 21 for i, key in enumerate(PIANO_KEYS)}
+# key name -> piano id (1-88)
+PIANO_KEY2PIANO = {key: i + 1 for i, key in enumerate(PIANO_KEYS)}
+# piano id - 1 -> key name, for fancy indexing
+PIANO_KEY_ARRAY = np.array(PIANO_KEYS)
+# sorted key names and their piano ids, for binary search
+_SORTED_PIANO_IDS = np.argsort(PIANO_KEY_ARRAY).astype(np.int64) + 1
+_SORTED_PIANO_KEYS = PIANO_KEY_ARRAY[_SORTED_PIANO_IDS - 1]
 # https://music.stackexchange.com/questions/23146/why-do-major-keys-contain-minor-chords
 SCALE2CHORD_TYPES = {
     'maj': ['maj', 'min', 'min', 'maj', 'maj', 'min', 'dim',],
@@ -49,11 +61,34 @@ def octave_shift(key_name: Union[str, List[str]], delta: int):
             ret += [x[:-1] + str(target_area)]
         return ret
 
+@lru_cache(maxsize=None)
+def _octave_shift_table(delta: int):
+    # midi id - 21 -> shifted midi id, going through the key names as octave_shift does (-1 if there is no such key)
+    table = np.full(len(PIANO_KEYS), -1, dtype=np.int64)
+    for i, key_name in enumerate(PIANO_KEYS):
+        target_area = int(key_name[-1]) + delta
+        if target_area > 0:
+            table[i] = PIANO_KEY2MIDI.get(key_name[:-1] + str(target_area), -1)
+    return table
+
+def octave_shift_midi(midi_ids: np.ndarray, delta: int):
+    """
+    Vectorized octave_shift over midi ids.
+    Args:
+        midi_ids (np.ndarray): midi ids (21-108).
+        delta (int): number of octaves.
+    Returns:
+        midi_ids (np.ndarray): the shifted midi ids.
+    """
+    ret = _octave_shift_table(delta)[np.asarray(midi_ids, dtype=np.int64) - 21]
+    assert (ret > 0).all(), 'octave shift out of the piano range'
+    return ret
+
 def key_shift(key_name: Union[str, List[str]], delta: int):
     if isinstance(key_name, str):
-        return PIANO_KEYS[PIANO_KEYS.index(key_name)+delta]
+        return PIANO_KEYS[PIANO_KEY2PIANO[key_name]-1+delta]
     elif isinstance(key_name, list):
-        return [PIANO_KEYS[PIANO_KEYS.index(x)+delta] for x in key_name]
+        return [PIANO_KEYS[PIANO_KEY2PIANO[x]-1+delta] for x in key_name]
 
 def piano_id2piano_key(piano_id: int):
     # 1-88 to A1-C9
@@ -61,11 +96,11 @@ def piano_id2piano_key(piano_id: int):
 
 def piano_key2piano_id(piano_key: str):
     # A1-C9 to 1-88
-    return PIANO_KEYS.index(piano_key) + 1
+    return PIANO_KEY2PIANO[piano_key]
 
 def piano_key2midi_id(piano_key: str):
     # A1-C9 to 21-108
-    return PIANO_KEYS.index(piano_key) + 21
+    return PIANO_KEY2MIDI[piano_key]
 
 def midi_id2piano_key(midi_id: int):
     # 21-108 to A1-C9
@@ -79,6 +114,40 @@ def piano_id2midi_id(midi_id: int):
     # 1-88 to 21-108
     return midi_id + 20
 
+def piano_keys2piano_ids(piano_keys: np.ndarray):
+    """
+    Vectorized piano_key2piano_id, a binary search over the sorted key names.
+    Args:
+        piano_keys (np.ndarray): key names, of any shape.
+    Returns:
+        piano_ids (np.ndarray): piano ids (1-88) of the same shape.
+    """
+    piano_keys = np.asarray(piano_keys, dtype=PIANO_KEY_ARRAY.dtype)
+    i = np.minimum(np.searchsorted(_SORTED_PIANO_KEYS, piano_keys), len(PIANO_KEYS) - 1)
+    if not (_SORTED_PIANO_KEYS[i] == piano_keys).all():
+        raise KeyError(f'unknown key names {np.unique(piano_keys[_SORTED_PIANO_KEYS[i] != piano_keys]).tolist()}')
+    return _SORTED_PIANO_IDS[i]
+
+def piano_keys2midi_ids(piano_keys: np.ndarray):
+    # vectorized piano_key2midi_id, A1-C9 to 21-108
+    return piano_keys2piano_ids(piano_keys) + 20
+
+def piano_ids2piano_keys(piano_ids: np.ndarray):
+    """
+    Vectorized piano_id2piano_key.
+    Args:
+        piano_ids (np.ndarray): piano ids (1-88), of any shape.
+    Returns:
+        piano_keys (np.ndarray): key names of the same shape.
+    """
+    piano_ids = np.asarray(piano_ids, dtype=np.int64)
+    assert ((piano_ids >= 1) & (piano_ids <= 88)).all(), 'piano id out of the piano range'
+    return PIANO_KEY_ARRAY[piano_ids - 1]
+
+def midi_ids2piano_keys(midi_ids: np.ndarray):
+    # vectorized midi_id2piano_key, 21-108 to A1-C9
+    return piano_ids2piano_keys(np.asarray(midi_ids, dtype=np.int64) - 20)
+
 def sec2hhmmss(sec: float):
     return str(timedelta(seconds=sec))
 
@@ -97,6 +166,7 @@ def preview_wave(y: np.ndarray, sr: int = DEFAULT_SR):
         y (np.ndarray): the waveform to be previewed
         sr (int, optional): sample rate. Defaults to 44100.
     """
+    from playsound import playsound
     tmp_addr = 'tmp.wav'
     sf.write(tmp_addr, y, sr)
     try:
@@ -133,6 +203,20 @@ def beat2index(pos_in_pattern: float, bpm: int = 128, sr: int = DEFAULT_SR):
     """
     return int(pos_in_pattern * 60 * sr / bpm)
 
+def beats2indices(pos_in_pattern: np.ndarray, bpm: int = 128, sr: int = DEFAULT_SR):
+    """
+    Vectorized beat2index, for many positions at once.
+
+    Args:
+        pos_in_pattern (np.ndarray): positions in a pattern in terms of beat.
+        bpm (int, optional): beats per minutes. Defaults to 128.
+        sr (int, optional): sample rate. Defaults to 44100.
+
+    Returns:
+        indices (np.ndarray): the sample indices in the waveform.
+    """
+    return (np.asarray(pos_in_pattern, dtype=float) * 60 * sr / bpm).astype(np.int64)
+
 def add_y(target_y: np.ndarray, source_y: np.ndarray, st_index: int):
     """
     Add the source waveform to the target waveform from the start index of the target.
@@ -148,6 +232,131 @@ def add_y(target_y: np.ndarray, source_y: np.ndarray, st_index: int):
     target_y[st_index:ed_index, :] += source_y[:ed_index-st_index, :]
 
 
+def add_y_batch(
+    target_y: np.ndarray,
+    source_ys: List[np.ndarray],
+    source_ids: np.ndarray,
+    st_indices: np.ndarray,
+    empty_target: bool = False,
+):
+    """
+    Add many placements of a few distinct source waveforms to the target waveform.
+    The result is identical to calling add_y for each placement in the given order. Float addition is commutative,
+    so the order only matters on samples covered by two placements or more (three if the target holds only zeros);
+    placements that never reach such a sample are added in any order, and the runs of them that repeat a source at
+    a constant spacing (e.g. a note played on every beat) are added at once through a strided
+    (num_placements, source_len) view of the target. The placements that do reach one are added afterwards,
+    one slice add each, in the given order.
+    Start indices may be negative (placements that began before the target), the overhang is dropped.
+    This function modifies the target waveform in-place.
+    Args:
+        target_y (np.ndarray): the target waveform.
+        source_ys (List[np.ndarray]): the distinct source waveforms.
+        source_ids (np.ndarray): index into source_ys for each placement.
+        st_indices (np.ndarray): start index for each placement.
+        empty_target (bool, optional): the target holds only zeros. Defaults to False.
+    """
+    source_ids = np.asarray(source_ids, dtype=np.int64)
+    st_indices = np.asarray(st_indices, dtype=np.int64)
+    source_lens = np.array([source_y.shape[0] for source_y in source_ys], dtype=np.int64)
+    lens = source_lens[source_ids]
+    ed_indices = st_indices + lens
+    num_samples = target_y.shape[0]
+
+    # coverage between consecutive start/end events, ends before starts at the same sample
+    events = np.concatenate([st_indices, ed_indices])
+    deltas = np.concatenate([np.ones_like(st_indices), -np.ones_like(ed_indices)])
+    order = np.lexsort((deltas, events))
+    events, coverage = events[order], np.cumsum(deltas[order])
+    deep = (coverage[:-1] >= (3 if empty_target else 2)) & (events[1:] > events[:-1])
+    deep_st, deep_ed = events[:-1][deep], events[1:][deep]
+    # deep segments are disjoint and sorted, so only the last one starting before a placement ends can reach it
+    last = np.searchsorted(deep_st, ed_indices, side='left') - 1
+    is_deep = (last >= 0) & (deep_ed[np.maximum(last, 0)] > st_indices) if len(deep_st) else np.zeros(len(lens), dtype=bool)
+
+    shallow = ~is_deep & (lens > 0)
+    inside = shallow & (st_indices >= 0) & (ed_indices <= num_samples)
+    # runs: placements of a source one spacing apart, at the spacing it repeats at most often (e.g. one bar)
+    run_ids = np.flatnonzero(inside)
+    run_ids = run_ids[np.lexsort((st_indices[run_ids], source_ids[run_ids]))]
+    source_bounds = np.flatnonzero(np.diff(source_ids[run_ids])) + 1
+    singles = []
+    row_stride, col_stride = target_y.strides
+    for placements in np.split(run_ids, source_bounds) if len(run_ids) else []:
+        source_y = source_ys[int(source_ids[placements[0]])]
+        sts = st_indices[placements]
+        # spacings to the next few placements, those shorter than the source would overlap
+        spacings = np.concatenate(
+            [sts[k:] - sts[:-k] for k in range(1, min(len(sts), RUN_NEIGHBOURS + 1))] + [np.zeros(0, dtype=np.int64)]
+        )
+        spacings = spacings[spacings >= source_y.shape[0]]
+        if len(spacings) == 0:
+            singles.append(placements)
+            continue
+        values, counts = np.unique(spacings, return_counts=True)
+        spacing = int(values[np.argmax(counts)])
+        # sorted by phase then start, a run is a chain of placements exactly one spacing apart
+        order = np.lexsort((sts, sts % spacing))
+        placements, sts = placements[order], sts[order]
+        bounds = np.append(np.flatnonzero(np.concatenate([[True], np.diff(sts) != spacing])), len(sts))
+        for i, j in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            if j - i == 1:
+                singles.append(placements[i:j])
+                continue
+            view = np.lib.stride_tricks.as_strided(
+                target_y[int(sts[i]):],
+                shape=(j - i, source_y.shape[0], target_y.shape[1]),
+                strides=(spacing * row_stride, row_stride, col_stride),
+                writeable=True,
+            )
+            view += source_y[None]
+
+    # the rest: shallow placements in any order, then deep ones in the given order
+    rest = np.concatenate([
+        np.concatenate(singles + [np.zeros(0, dtype=np.int64)]),
+        np.flatnonzero(shallow & ~inside),
+        np.flatnonzero(is_deep),
+    ])
+    source_st_indices = np.maximum(-st_indices[rest], 0)
+    clipped_st_indices = np.maximum(st_indices[rest], 0)
+    clipped_ed_indices = np.minimum(ed_indices[rest], num_samples)
+    for source_id, source_st, st_index, ed_index in zip(
+        source_ids[rest].tolist(), source_st_indices.tolist(), clipped_st_indices.tolist(), clipped_ed_indices.tolist()
+    ):
+        if ed_index > st_index:
+            target_y[st_index:ed_index, :] += source_ys[source_id][source_st:source_st+ed_index-st_index, :]
+
+
+def mul_periodic(source_y: np.ndarray, unit: np.ndarray, offset: int = 0):
+    """
+    Multiply a waveform by a periodic envelope, given by one cycle of the envelope.
+    The cycle is broadcast over a (num_cycles, cycle_length) view of the waveform,
+    so the repeated envelope is never materialized.
+    Args:
+        source_y (np.ndarray): the waveform, of shape (num_samples, num_channels).
+        unit (np.ndarray): one cycle of the envelope.
+        offset (int, optional): phase of the first sample within the cycle. Defaults to 0.
+    Returns:
+        ret (np.ndarray): the product.
+    """
+    n, unit_len = source_y.shape[0], unit.shape[0]
+    ret = np.empty(source_y.shape, dtype=np.result_type(source_y, unit))
+    # head: the rest of the cycle the waveform starts in
+    phase = offset % unit_len
+    head = min(n, (unit_len - phase) % unit_len)
+    np.multiply(source_y[:head], unit[phase:phase+head, None], out=ret[:head])
+    num_cycles = (n - head) // unit_len
+    full = head + num_cycles * unit_len
+    if num_cycles:
+        np.multiply(
+            source_y[head:full].reshape(num_cycles, unit_len, -1),
+            unit[None, :, None],
+            out=ret[head:full].reshape(num_cycles, unit_len, -1),
+        )
+    np.multiply(source_y[full:], unit[:n-full, None], out=ret[full:])
+    return ret
+
+
 def get_chord_notes(
     chord_id: int,  # 1, 2, 3, 4, 5, 6, 7
     scale_root: str = 'C',
@@ -303,6 +512,192 @@ def chord_seq_parser(
     return score, roots
 
 
+def _run_chunks(
+    values: np.ndarray,
+    keep: np.ndarray,
+    chunk_len: int,
+    breaks: np.ndarray = None,
+):
+    # maximal runs of equal values within every row of (num_seqs, seq_len) arrays (also cut where breaks is set),
+    # runs starting on a dropped position are skipped, the others are cut into chunks of at most chunk_len from their start
+    seq_len = values.shape[1]
+    values, keep = values.reshape(-1), keep.reshape(-1)
+    n = len(values)
+    new = np.ones(n, dtype=bool)
+    new[1:] = values[1:] != values[:-1]
+    new[::max(seq_len, 1)] = True
+    if breaks is not None:
+        new |= breaks.reshape(-1)
+    run_st = np.flatnonzero(new)
+    run_len = np.diff(np.append(run_st, n))
+    run_st, run_len = run_st[keep[run_st]], run_len[keep[run_st]]
+    num_chunks = -(-run_len // chunk_len)
+    # index of every chunk in its run
+    chunk_ids = np.arange(num_chunks.sum()) - np.repeat(np.cumsum(num_chunks) - num_chunks, num_chunks)
+    st = np.repeat(run_st, num_chunks) + chunk_ids * chunk_len
+    length = np.minimum(np.repeat(run_len, num_chunks) - chunk_ids * chunk_len, chunk_len)
+    return st // max(seq_len, 1), st % max(seq_len, 1), length
+
+
+def parse_note_seq(
+    note_seq: np.ndarray,
+    sig: str = '4/4',
+    resolution: float = 1/16,
+    max_value: float = 1/4,
+    input_id_type: str = 'midi',
+    rest_id: int = 0,
+):
+    """
+    Vectorized note_seq_parser: run-length segmentation of a sequence of integers into notes.
+    Assume the sequence starts in the beginning of a pattern.
+    A batch of sequences of the same length is parsed in one call, as rows of a 2-d array.
+
+    Args:
+        note_seq (np.ndarray): the sequence of integers, or sequences of shape (num_seqs, seq_len).
+        sig (str, optional): signature. Defaults to '4/4'.
+        resolution (float, optional): length of the shortest note (one integer). Defaults to 1/16.
+        max_value (float, optional): maximum value of parsed note, longer runs are split. Defaults to 1/4.
+        input_id_type (str, optional): meaning of input integers (midi or piano). Defaults to 'midi'.
+        rest_id (int, optional): the integer for rests. Defaults to 0.
+
+    Returns:
+        score (Dict[str, np.ndarray]): the notes as columns 'midi_id', 'note_value' and 'pos' (unit is beat), in the order of note_seq_parser.
+            Parsing a batch adds the column 'seq_id', the row of every note.
+    """
+    _, beat_value = parse_sig(sig)
+    assert input_id_type in ('midi', 'piano')
+    note_seq = np.asarray(note_seq, dtype=np.int64)
+    batch = note_seq.ndim == 2
+    note_seq = note_seq.reshape(-1 if batch else 1, note_seq.shape[-1])
+    seq_ids, st, length = _run_chunks(note_seq, note_seq != rest_id, ceil(max_value / resolution))
+    midi_ids = note_seq[seq_ids, st] if input_id_type == 'midi' else note_seq[seq_ids, st] + 20
+    assert ((midi_ids >= 21) & (midi_ids <= 108)).all(), 'note out of the piano range'
+    score = {
+        'midi_id': midi_ids,
+        # same arithmetic as note_seq_parser
+        'note_value': resolution * length,
+        'pos': resolution * st / beat_value,
+    }
+    if batch:
+        score['seq_id'] = seq_ids
+    return score
+
+
+@lru_cache(maxsize=256)
+def _chord_voicings(scale_root, scale_type, root_area, del_second, decr_octave, incr_octave, decor_items):
+    decor_map = dict(decor_items)
+    chords = [[]]
+    for chord_id in range(1, 8):
+        key_names, _ = get_chord_notes(
+            chord_id=chord_id,
+            scale_root=scale_root,
+            scale_type=scale_type,
+            root_area=root_area,
+            del_second=del_second,
+            decr_octave=decr_octave,
+            incr_octave=incr_octave,
+            decor_notes=list(decor_map.get(chord_id, [])),
+        )
+        chords.append([PIANO_KEY2MIDI[key_name] for key_name in key_names])
+    num_notes = np.array([len(chord) for chord in chords], dtype=np.int64)
+    voicings = np.zeros((len(chords), num_notes.max()), dtype=np.int64)
+    for chord_id, chord in enumerate(chords):
+        voicings[chord_id, :len(chord)] = chord
+    voicings.setflags(write=False)
+    num_notes.setflags(write=False)
+    return voicings, num_notes
+
+
+def chord_voicings(
+    scale_root: str = 'C',
+    scale_type: str = 'maj',
+    root_area: str = '4',
+    del_second: bool = False,
+    decr_octave: bool = True,
+    incr_octave: bool = False,
+    decor_map: Dict[int, List[int]] = dict(),
+):
+    """
+    The notes of the 7 chords of a scale (see get_chord_notes), built once per setting.
+
+    Returns:
+        voicings (np.ndarray): read-only midi ids from low to high of shape (8, max_num_notes), row i is chord i (row 0 is empty), padded with 0.
+        num_notes (np.ndarray): read-only number of notes of every chord, of shape (8,).
+    """
+    decor_items = tuple(sorted((chord_id, tuple(decor_notes)) for chord_id, decor_notes in decor_map.items()))
+    return _chord_voicings(scale_root, scale_type, root_area, del_second, decr_octave, incr_octave, decor_items)
+
+
+def parse_chord_seq(
+    chord_seq: np.ndarray,
+    note_seq: np.ndarray = None,
+    sig: str = '4/4',
+    resolution: float = 1/16,
+    max_value: float = 1/4,
+    rest_id: int = 0,
+    scale_root: str = 'C',
+    scale_type: str = 'maj',
+    root_area: str = '4',  # C3, D3, E3......
+    del_second: bool = False,
+    decr_octave: bool = True,
+    incr_octave: bool = False,
+    decor_map: Dict[int, List[int]] = dict(),
+):
+    """
+    Vectorized chord_seq_parser: run-length segmentation of a sequence of chord ids, conditioning on a melody
+    (a rest in the melody ends the chord), with the chord notes looked up in chord_voicings.
+    Assume the sequence starts in the beginning of a pattern.
+    A batch of sequences of the same length is parsed in one call, as rows of 2-d arrays.
+
+    Args:
+        chord_seq (np.ndarray): the sequence of integers for chords, or sequences of shape (num_seqs, seq_len).
+        note_seq (np.ndarray, optional): the sequence of integers for melody, of the same shape. Defaults to None (no rests).
+        sig (str, optional): signature. Defaults to '4/4'.
+        resolution (float, optional): length of the shortest note (one integer). Defaults to 1/16.
+        max_value (float, optional): maximum value of parsed note, longer chords are split. Defaults to 1/4.
+        rest_id (int, optional): the integer for rests. Defaults to 0.
+        decor_map (Dict[int, List[int]], optional): the mapping from chord index to the recipe of decoration notes. Defaults to None.
+    Returns:
+        score (Dict[str, np.ndarray]): the chord notes as columns 'midi_id', 'note_value' and 'pos' (unit is beat), chord by chord, low to high.
+        roots (Dict[str, np.ndarray]): the lowest note of every chord, same columns.
+            Parsing a batch adds the column 'seq_id' to both, the row of every note.
+    """
+    _, beat_value = parse_sig(sig)
+    chord_seq = np.asarray(chord_seq, dtype=np.int64)
+    batch = chord_seq.ndim == 2
+    chord_seq = chord_seq.reshape(-1 if batch else 1, chord_seq.shape[-1])
+    if note_seq is None:
+        note_seq = np.full(chord_seq.shape, -1)
+    rest = np.asarray(note_seq).reshape(chord_seq.shape) == rest_id
+    # a rest is a segment of its own, so the chords around it are cut
+    breaks = rest.copy()
+    breaks[:, 1:] |= rest[:, :-1]
+    seq_ids, st, length = _run_chunks(chord_seq, ~rest, ceil(max_value / resolution), breaks)
+    chord_ids = chord_seq[seq_ids, st]
+    assert ((chord_ids >= 1) & (chord_ids <= 7)).all(), 'chord id out of 1-7'
+    note_value = resolution * length
+    pos = resolution * st / beat_value
+
+    voicings, num_notes = chord_voicings(scale_root, scale_type, root_area, del_second, decr_octave, incr_octave, decor_map)
+    counts = num_notes[chord_ids]
+    chord_index = np.repeat(np.arange(len(chord_ids)), counts)
+    note_index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    score = {
+        'midi_id': voicings[chord_ids[chord_index], note_index],
+        'note_value': note_value[chord_index],
+        'pos': pos[chord_index],
+    }
+    roots = {
+        'midi_id': voicings[chord_ids, 0],
+        'note_value': note_value,
+        'pos': pos,
+    }
+    if batch:
+        score['seq_id'] = seq_ids[chord_index]
+        roots['seq_id'] = seq_ids
+    return score, roots
+
+
 def pos2index(
     global_pos: int,
     local_pos: float,
@@ -313,6 +708,23 @@ def pos2index(
     beats_per_bar, _ = parse_sig(sig)
     return int((global_pos * beats_per_bar + local_pos) * 60 * sr / bpm)
 
+def db2amp(db: float):
+    # same convention as pedalboard.Gain
+    return 10 ** (db / 20)
+
+def pos2indices(
+    global_pos: np.ndarray,
+    local_pos: np.ndarray,
+    sr: int = DEFAULT_SR,
+    sig: str = '4/4',
+    bpm: int = 128,
+):
+    # vectorized pos2index, same arithmetic so that every index is identical
+    beats_per_bar, _ = parse_sig(sig)
+    global_pos = np.asarray(global_pos, dtype=np.int64)
+    local_pos = np.asarray(local_pos, dtype=float)
+    return ((global_pos * beats_per_bar + local_pos) * 60 * sr / bpm).astype(np.int64)
+
 # [chord_id, start_global_pos, end_global_pos]
 COMMON_CHORD_PROG = (
     [[6, 0, 1], [4, 1, 2], [5, 2, 3], [1, 3, 4]],